@@ -198,12 +198,13 @@ def test_ascom_camera_shm(ps3: PS3CLIClient):
             time.sleep(0.1)
         t0 = time.time()
         print("Reading image array")
-        image_array = camera.ImageArray
+        # Convert the marshalled SAFEARRAY straight to uint16, without an intermediate object/int64 array
+        image_array = np.asarray(camera.ImageArray, dtype=np.uint16)
         t1 = time.time() - t0
         print(t1, "sec")
         print("Copying to shm")
         shared_image = np.ndarray((camera.NumX, camera.NumY), dtype=np.uint16, buffer=image_shm.buf)
-        shared_image[:] = image_array[:]
+        np.copyto(shared_image, image_array)
         print(time.time()-t0, "sec")
 
         result = ps3.begin_platesolve_shm(image_shm.name, camera.NumX, camera.NumY, arcsec_per_pixel_guess)
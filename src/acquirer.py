@@ -1,31 +1,91 @@
-import time
 import logging
-from common.utils import function_name, Coord
+import time
+from common.utils import function_name
 from common.paths import PathMaker
 from common.mast_logging import init_log
 from common.activities import UnitActivities
-from common.utils import UnitRoi, CanonicalResponse
+from common.utils import CanonicalResponse
 from common.corrections import correction_phases
 from common.filer import Filer, FilerTop
 from stage import StagePresetPosition
-from camera import CameraSettings, CameraBinning
-from astropy.coordinates import Angle
-import astropy.units as u
-from solving import SolvingTolerance
-from threading import Thread
+from camera import CameraSettings
+from concurrent.futures import ThreadPoolExecutor, Future
+from threading import Lock
 from acquisition import Acquisition
+from async_writer import AsyncFrameWriter
 import os
 
 logger = logging.getLogger('mast.unit.' + __name__)
 init_log(logger)
 
+# a single, long-lived worker: acquisitions are serialized and no thread is created per request
+acquisition_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='acquisition')
+# lets the stage be commanded while the acquisition thread talks to the mount
+positioning_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='positioning')
+
+
+def log_phase_banner(op: str, phase: str):
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    logger.info("%s: >>>>>>>>>>>>>>>>>>>>>>>>>>", op)
+    logger.info("%s: >>> starting phase='%s' <<<", op, phase)
+    logger.info("%s: >>>>>>>>>>>>>>>>>>>>>>>>>>", op)
+
 
 class Acquirer:
 
+    MAX_MOTION_SECONDS: float = 180
+
     def __init__(self, unit: 'Unit'):
         self.unit: 'Unit' = unit
         self.folder: str | None = None
         self.latest_acquisition: Acquisition | None = None
+        # the acquisition executor's latest job, a new one is refused while it has not ended
+        self.job: Future | None = None
+        self.job_lock: Lock = Lock()
+
+    def wait_for_motion_end(self, settle_seconds: float, mount: bool = True):
+        """
+        Waits for the stage (and, optionally, the mount) drivers to signal end-of-motion, then
+         for the mount axes to settle, for at most settle_seconds.  After a stage-only motion there
+         are no mount axes to watch, the stage is given the full settle_seconds.
+        """
+        op = function_name()
+
+        still_moving = self.unit.wait_until_idle(timeout=Acquirer.MAX_MOTION_SECONDS, mount=mount, focuser=False)
+        if still_moving:
+            logger.warning(f"{op}: {still_moving} did not stop moving within {Acquirer.MAX_MOTION_SECONDS} seconds")
+
+        if not mount:
+            logger.info(f"{op}: sleeping {settle_seconds:.1f} seconds to let the stage settle ...")
+            time.sleep(settle_seconds)
+        elif not self.unit.mount.wait_for_encoder_stable(max_wait_seconds=settle_seconds):
+            logger.warning(f"{op}: mount axes did not settle within {settle_seconds:.1f} seconds")
+
+    def move_into_position(self, preset: StagePresetPosition, ra_j2000_hours: float, dec_j2000_degs: float,
+                           start_tracking: bool = False):
+        """
+        Commands the stage (to the preset) and the mount (to the target) concurrently.
+         Returns once both commands were issued, not when the motion ends (see wait_for_motion_end)
+        """
+        stage_command = positioning_executor.submit(self.unit.stage.move_to_preset, preset)
+
+        if start_tracking:
+            self.unit.mount.start_tracking()
+        self.unit.mount.goto_ra_dec_j2000(ra_j2000_hours, dec_j2000_degs)
+
+        stage_command.result()
+
+    def prepare_camera(self, settings: CameraSettings):
+        """
+        Sets up the camera for the coming exposure, meant to overlap the mount/stage motion
+        """
+        op = function_name()
+
+        errors = self.unit.camera.prepare(settings)
+        if errors:
+            # not fatal, the exposure will try again and report
+            logger.warning(f"{op}: could not prepare the camera: {errors}")
 
     def do_solve_and_correct(self,
                              target_ra_j2000_hours: float,
@@ -40,21 +100,15 @@ class Acquirer:
         :return:
         """
         op = function_name()
-        acquisition_conf = self.unit.unit_conf['acquisition']
+        config = self.latest_acquisition.config
 
         self.unit.start_activity(UnitActivities.Positioning)
         #
         # Move the stage and mount into position
         #
         preset: StagePresetPosition = StagePresetPosition.Sky if phase == 'sky' else StagePresetPosition.Spec
-        self.unit.stage.move_to_preset(preset)
-
-        self.unit.mount.goto_ra_dec_j2000(target_ra_j2000_hours, target_dec_j2000_degs)
-
-        while self.unit.stage.is_moving or self.unit.mount.is_slewing:
-            time.sleep(1)
-        logger.info(f"{op}: sleeping 10 seconds to let the mount stop ...")
-        time.sleep(10)
+        self.move_into_position(preset, target_ra_j2000_hours, target_dec_j2000_degs)
+        self.wait_for_motion_end(config.settle_seconds)
         self.unit.end_activity(UnitActivities.Positioning)
 
         # Prepare camera settings
@@ -70,43 +124,36 @@ class Acquirer:
         # Possible folder names:
         #  .../<date>/Acquisitions/target=<ra>,<dec>,time<datetime>/{sky|spec|guiding|testing,00000X}
         #
-        self.folder = PathMaker().make_acquisition_folder(
-            phase=phase,
-            tags={
-                'target': f"{target_ra_j2000_hours},{target_dec_j2000_degs}",
-            })
         if phase == 'testing':
-            self.folder += ',' + PathMaker().make_seq(self.folder)
-        self.folder = os.path.join(self.folder, phase)
-        os.makedirs(self.folder, exist_ok=True)
+            # each test gets its own, numbered, folder
+            path_maker = PathMaker()
+            folder = path_maker.make_acquisition_folder(
+                phase=phase,
+                tags={
+                    'target': f"{target_ra_j2000_hours},{target_dec_j2000_degs}",
+                })
+            self.folder = os.path.join(folder + ',' + path_maker.make_seq(folder), phase)
+            os.makedirs(self.folder, exist_ok=True)
+        else:
+            # already made (and created) by the acquisition
+            self.folder = self.latest_acquisition.phase_folder(phase)
 
         acquisition_settings = CameraSettings(
-            seconds=acquisition_conf['exposure'],
+            seconds=config.exposure,
             base_folder=self.folder,
-            gain=acquisition_conf['gain'],
-            binning=CameraBinning(acquisition_conf['binning']['x'], acquisition_conf['binning']['y']),
-            roi=UnitRoi.from_dict(acquisition_conf['roi']).to_camera_roi(),
+            gain=config.gain,
+            binning=self.latest_acquisition.binning,
+            roi=self.latest_acquisition.camera_roi,
             save=True
         )
 
-        # Figure out tolerances
-        default_tolerance: Angle = Angle(1 * u.arcsecond)
-        ra_tolerance: Angle = default_tolerance
-        dec_tolerance: Angle = default_tolerance
-        if 'tolerance' in acquisition_conf:
-            if 'ra_arcsec' in acquisition_conf['tolerance']:
-                ra_tolerance = Angle(acquisition_conf['tolerance']['ra_arcsec'] * u.arcsecond)
-            if 'dec_arcsec' in acquisition_conf['tolerance']:
-                dec_tolerance = Angle(acquisition_conf['tolerance']['dec_arcsec'] * u.arcsecond)
-
-        target = Coord(ra=Angle(target_ra_j2000_hours * u.hour), dec=Angle(target_dec_j2000_degs * u.deg))
-
-        if not self.unit.solver.solve_and_correct(target=target,
+        if not self.unit.solver.solve_and_correct(target=self.latest_acquisition.target,
                                                   camera_settings=acquisition_settings,
-                                                  solving_tolerance=SolvingTolerance(ra_tolerance, dec_tolerance),
+                                                  solving_tolerance=self.latest_acquisition.solving_tolerance,
                                                   phase=phase,
                                                   parent_activity=UnitActivities.Acquiring,
-                                                  max_tries=10):
+                                                  max_tries=10,
+                                                  max_wall_seconds=config.max_seconds):
             logger.info(f"{op}: solve_and_correct failed")
         logger.info(f"{op}: solve_and_correct done.")
 
@@ -123,95 +170,79 @@ class Acquirer:
         self.unit.reference_image = None
 
         self.latest_acquisition = acquisition
-        acquisition_conf = acquisition.conf
+        config = acquisition.config
         target_ra_j2000_hours: float = acquisition.target_ra
         target_dec_j2000_degs: float = acquisition.target_dec
 
         self.unit.start_activity(UnitActivities.Acquiring)
+        target = acquisition.target
+
         phase = 'sky'
+        log_phase_banner(op, phase)
+        phase_folder = acquisition.phase_folder(phase)
+        sky_settings = CameraSettings(
+            seconds=config.exposure,
+            base_folder=phase_folder,
+            gain=config.gain,
+            binning=acquisition.binning,
+            roi=acquisition.camera_roi,
+            save=True
+        )
 
-        logger.info(f"{op}: >>>>>>>>>>>>>>>>>>>>>>>>>>")
-        logger.info(f"{op}: >>> starting {phase=} <<<")
-        logger.info(f"{op}: >>>>>>>>>>>>>>>>>>>>>>>>>>")
         #
-        # move the stage and mount into position
+        # move the stage and mount into position, set up the camera while they move
         #
         self.unit.start_activity(UnitActivities.Positioning)
-        self.unit.stage.move_to_preset(StagePresetPosition.Sky)
-
-        self.unit.mount.start_tracking()
-        self.unit.mount.goto_ra_dec_j2000(target_ra_j2000_hours, target_dec_j2000_degs)
-        while self.unit.stage.is_moving or self.unit.mount.is_slewing:
-            time.sleep(1)
-        logger.info(f"{op}: sleeping 10 seconds to let the mount and stage stop moving ...")
-        time.sleep(10)
+        self.move_into_position(StagePresetPosition.Sky, target_ra_j2000_hours, target_dec_j2000_degs,
+                                start_tracking=True)
+        self.prepare_camera(sky_settings)
+        self.wait_for_motion_end(config.settle_seconds)
         self.unit.end_activity(UnitActivities.Positioning)
 
-        sky_settings = CameraSettings(
-            seconds=acquisition_conf['exposure'],
-            base_folder=os.path.join(self.latest_acquisition.folder, phase),
-            gain=acquisition_conf['gain'],
-            binning=CameraBinning(acquisition_conf['binning']['x'], acquisition_conf['binning']['y']),
-            roi=UnitRoi.from_dict(acquisition_conf['roi']).to_camera_roi(),
-            save=True
-        )
-
         #
         # loop trying to solve and correct the mount till within tolerances
         #
-        tries: int = acquisition_conf['tries'] if 'tries' in acquisition_conf else 3
-
-        # set up the tolerances
-        default_tolerance: Angle = Angle(1 * u.arcsecond)
-        ra_tolerance: Angle = default_tolerance
-        dec_tolerance: Angle = default_tolerance
-        if 'tolerance' in acquisition_conf:
-            if 'ra_arcsec' in acquisition_conf['tolerance']:
-                ra_tolerance = Angle(acquisition_conf['tolerance']['ra_arcsec'] * u.arcsecond)
-            if 'dec_arcsec' in acquisition_conf['tolerance']:
-                dec_tolerance = Angle(acquisition_conf['tolerance']['dec_arcsec'] * u.arcsecond)
-
-        target = Coord(ra=Angle(target_ra_j2000_hours * u.hour), dec=Angle(target_dec_j2000_degs * u.deg))
-
         achieved_tolerances = self.unit.solver.solve_and_correct(target=target,
                                                                  camera_settings=sky_settings,
-                                                                 solving_tolerance=
-                                                                 SolvingTolerance(ra_tolerance, dec_tolerance),
+                                                                 solving_tolerance=acquisition.solving_tolerance,
                                                                  parent_activity=UnitActivities.Acquiring,
                                                                  phase='sky',
-                                                                 max_tries=tries)
+                                                                 max_tries=config.tries,
+                                                                 max_wall_seconds=config.max_seconds)
         logger.info(f"{op}: {phase=} {achieved_tolerances=}")
         self.latest_acquisition.save_corrections(phase)
 
         if not achieved_tolerances:
+            AsyncFrameWriter().flush()
+            acquisition.flush_to_shared()
             self.unit.end_activity(UnitActivities.Acquiring)
             self.unit.mount.stop_tracking()
             return
 
         phase = 'spec'
-        logger.info(f"{op}: >>>>>>>>>>>>>>>>>>>>>>>>>>")
-        logger.info(f"{op}: >>> starting {phase=} <<<")
-        logger.info(f"{op}: >>>>>>>>>>>>>>>>>>>>>>>>>>")
+        log_phase_banner(op, phase)
+        phase_folder = acquisition.phase_folder(phase)
+
+        spec_settings = self.unit.guider.make_guiding_settings(base_folder=phase_folder)
 
         self.unit.stage.move_to_preset(StagePresetPosition.Spec)
-        while self.unit.stage.is_moving:
-            time.sleep(.2)
-        logger.info(f"sleeping additional 5 seconds to let the stage stop moving ...")
-        time.sleep(5)
+        self.prepare_camera(spec_settings)
+        self.wait_for_motion_end(config.settle_seconds, mount=False)
         logger.info(f"stage now at {self.unit.stage.position}")
 
-        spec_settings = self.unit.guider.make_guiding_settings(
-            base_folder=os.path.join(self.latest_acquisition.folder, phase))
         achieved_tolerances = self.unit.solver.solve_and_correct(target=target,
                                                                  camera_settings=spec_settings,
-                                                                 solving_tolerance=
-                                                                 SolvingTolerance(ra_tolerance, dec_tolerance),
+                                                                 solving_tolerance=acquisition.solving_tolerance,
                                                                  phase=phase,
                                                                  parent_activity=UnitActivities.Acquiring,
-                                                                 max_tries=tries)
+                                                                 max_tries=config.tries,
+                                                                 max_wall_seconds=config.max_seconds,
+                                                                 hint=acquisition.last_solution)
         self.latest_acquisition.save_corrections(phase)
         logger.info(f"{op}: {phase=} {achieved_tolerances=}")
         if not achieved_tolerances:
+            AsyncFrameWriter().flush()
+            acquisition.flush_to_shared()
             self.unit.end_activity(UnitActivities.Acquiring)
             self.unit.mount.stop_tracking()
             return
@@ -219,20 +250,35 @@ class Acquirer:
         self.unit.reference_image = self.unit.camera.image
 
         phase = 'guiding'
-        logger.info(f"{op}: >>>>>>>>>>>>>>>>>>>>>>>>>>")
-        logger.info(f"{op}: >>> starting {phase=} <<<")
-        logger.info(f"{op}: >>>>>>>>>>>>>>>>>>>>>>>>>>")
+        log_phase_banner(op, phase)
+        phase_folder = acquisition.phase_folder(phase)
 
         # the guider runs until UnitActivities.Guiding is stopped
         self.unit.guider.do_guide_by_solving_with_shm(
             target=target,
-            folder=os.path.join(self.latest_acquisition.folder, phase)
+            folder=phase_folder
         )
 
+        AsyncFrameWriter().flush()
         self.unit.end_activity(UnitActivities.Acquiring)
         self.unit.mount.stop_tracking()
         self.unit.acquirer.latest_acquisition.post_process()
 
+    def run_in_background(self, func, *args):
+        """
+        Runs one of the acquisition executor's jobs.  A failure is logged (the executor's Future is
+         never looked at) and the activities the job may have left behind are ended.
+        """
+        op = function_name()
+        try:
+            func(*args)
+        except Exception as ex:
+            logger.exception(f"{op}: {func.__name__} failed", exc_info=ex)
+        finally:
+            for activity in (UnitActivities.Positioning, UnitActivities.Acquiring):
+                if self.unit.is_active(activity):
+                    self.unit.end_activity(activity)
+
     def start_acquisition(self, ra_j2000_hours: float, dec_j2000_degs: float):
         """
         Starts an acquisition
@@ -241,23 +287,42 @@ class Acquirer:
         :param dec_j2000_degs: The target's Dec
         :return: The folder path on the MAST-SHARE with the acquisition's products
         """
-        acquisition = Acquisition(
-            target_ra=ra_j2000_hours,
-            target_dec=dec_j2000_degs,
-            conf=self.unit.unit_conf['acquisition'],
-        )
-        Thread(name='acquisition', target=self.do_acquire, args=[acquisition]).start()
+        with self.job_lock:
+            if self.is_busy():
+                return CanonicalResponse(errors=["an acquisition is already running (guiding runs until stopped)"])
+            acquisition = Acquisition(
+                target_ra=ra_j2000_hours,
+                target_dec=dec_j2000_degs,
+                conf=self.unit.unit_conf['acquisition'],
+            )
+            self.job = acquisition_executor.submit(self.run_in_background, self.do_acquire, acquisition)
 
         return CanonicalResponse(value=Filer().change_top_to(FilerTop.Shared, acquisition.folder))
 
+    def is_busy(self) -> bool:
+        """
+        The acquisition executor has a single worker, a job submitted while it is busy would silently
+         wait behind the running one (possibly forever, guiding runs until stopped)
+        """
+        return self.job is not None and not self.job.done()
+
     def start_one_solve_and_correct(self, ra_j2000_hours: float, dec_j2000_degs: float):
         """
         This is for debugging via FastAPI, not for production
         """
-        self.latest_acquisition = Acquisition(target_ra=ra_j2000_hours,
-                                              target_dec=dec_j2000_degs,
-                                              conf=self.unit.unit_conf['acquisition'])
-        Thread(
-            name='solve-and-correct',
-            target=self.do_solve_and_correct,
-            args=[ra_j2000_hours, dec_j2000_degs, 'testing']).start()
+        with self.job_lock:
+            if self.is_busy():
+                return CanonicalResponse(errors=["an acquisition is already running (guiding runs until stopped)"])
+            acquisition = Acquisition(target_ra=ra_j2000_hours,
+                                      target_dec=dec_j2000_degs,
+                                      conf=self.unit.unit_conf['acquisition'])
+            self.job = acquisition_executor.submit(self.run_in_background, self.do_one_solve_and_correct,
+                                                   acquisition, ra_j2000_hours, dec_j2000_degs)
+
+    def do_one_solve_and_correct(self, acquisition: Acquisition, ra_j2000_hours: float, dec_j2000_degs: float):
+        """
+        Called from start_one_solve_and_correct().  The acquisition becomes the latest one only once
+         this job runs, a running job keeps reading its own.
+        """
+        self.latest_acquisition = acquisition
+        self.do_solve_and_correct(ra_j2000_hours, dec_j2000_degs, 'testing')
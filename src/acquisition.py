@@ -2,39 +2,153 @@ import datetime
 import logging
 from common.paths import PathMaker
 from common.mast_logging import init_log
+from common.utils import Coord, UnitRoi
+from common.camera import CameraBinning, CameraRoi
 from common.corrections import Corrections
 from plotting import plot_acquisition_corrections, plot_phase_corrections
 import os
-import json
+import orjson
 from common.filer import Filer
-from typing import Dict
+from common.extended_basemodel import ExtendedBaseModel
+from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from astropy.coordinates import Angle, angular_separation
+import astropy.units as u
 
 logger = logging.getLogger('mast.unit.' + __name__)
 init_log(logger)
 
+# the acquisition summary plot is made in the background, pyplot is not thread-safe so all our plotting is serialized
+plotting_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='acquisition-plotter')
+plotting_lock = Lock()
+# moves the acquisition products to the shared area, a few files at a time
+flush_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='acquisition-flush')
+
+
+class SolvingTolerance:
+    ra: Angle
+    dec: Angle
+
+    def __init__(self, ra: Angle, dec: Angle):
+        self.ra = ra
+        self.dec = dec
+
+
+class AcquisitionToleranceConfig(ExtendedBaseModel):
+    ra_arcsec: float = 1
+    dec_arcsec: float = 1
+
+
+class AcquisitionBinningConfig(ExtendedBaseModel):
+    x: int = 1
+    y: int = 1
+
+
+class AcquisitionConfig(ExtendedBaseModel):
+    """
+    The 'acquisition' section of the unit configuration, validated once per Acquisition
+    """
+    exposure: Optional[float] = None
+    gain: Optional[int] = None
+    binning: Optional[AcquisitionBinningConfig] = None
+    roi: Optional[Dict] = None
+    tolerance: AcquisitionToleranceConfig = AcquisitionToleranceConfig()
+    tries: int = 3
+    max_seconds: Optional[float] = None
+    settle_seconds: float = 3
+
 
 class Acquisition:
+
+    # a previous solution seeds the solver only if its center is this close to the target
+    HINT_MAX_SEPARATION: Angle = Angle(1, unit=u.deg)
+
     def __init__(self, target_ra: float, target_dec: float, conf: Dict):
         self.target_ra: float = target_ra
         self.target_dec: float = target_dec
+        self.target: Coord = Coord(ra=Angle(target_ra, unit=u.hour), dec=Angle(target_dec, unit=u.deg))
         self.conf = conf
-        self.ra_tolerance = conf['tolerance']['ra_arcsec']
-        self.dec_tolerance = conf['tolerance']['dec_arcsec']
+        self.config: AcquisitionConfig = AcquisitionConfig(**conf)
+
+        self.ra_tolerance: Angle = Angle(self.config.tolerance.ra_arcsec, unit=u.arcsec)
+        self.dec_tolerance: Angle = Angle(self.config.tolerance.dec_arcsec, unit=u.arcsec)
+        self.solving_tolerance: SolvingTolerance = SolvingTolerance(self.ra_tolerance, self.dec_tolerance)
+
+        # these depend only on the configuration, no need to rebuild them per phase
+        self.binning: CameraBinning | None = \
+            CameraBinning(self.config.binning.x, self.config.binning.y) if self.config.binning else None
+        self.camera_roi: CameraRoi | None = \
+            UnitRoi.from_dict(self.config.roi).to_camera_roi() if self.config.roi else None
         self.corrections: Dict[str, Corrections] = {}
         self.folder = PathMaker().make_acquisition_folder(
             tags={
                 'target': f"{target_ra},{target_dec}",
             })
+        self.phase_folders: Dict[str, str] = {}
+        self._pending_paths: List[str] = []
+        # the latest plate solving solution, used as a hint when solving the following phases
+        self.last_solution: Optional['PS3SolvingSolution'] = None
+
+    def hint_for(self, target: Coord) -> Optional['PS3SolvingSolution']:
+        """
+        The latest solution, if it may seed the solving of an image centered on target
+
+        :param target: The coordinates the image is expected to be centered on
+        :return: The latest solution, None if there is none or it is of another field
+        """
+        if self.last_solution is None:
+            return None
+        separation = angular_separation(self.last_solution.center_ra_j2000_rads * u.rad,
+                                        self.last_solution.center_dec_j2000_rads * u.rad,
+                                        target.ra, target.dec)
+        return self.last_solution if separation <= Acquisition.HINT_MAX_SEPARATION else None
+
+    def phase_folder(self, phase: str) -> str:
+        """
+        The folder for the products of the given phase, created on first use
+        """
+        if phase not in self.phase_folders:
+            folder = os.path.join(self.folder, phase)
+            os.makedirs(folder, exist_ok=True)
+            self.phase_folders[phase] = folder
+        return self.phase_folders[phase]
 
     def save_corrections(self, phase: str):
         if phase in self.corrections:
-            path = os.path.join(self.folder, phase, 'corrections.json')
-            with open(path, 'w') as fp:
-                json.dump((self.corrections[phase]).to_dict(), fp, indent=2)
-            plot_phase_corrections(phase=phase, corrections=self.corrections[phase], file=path,
-                                   ends_of_phases=[datetime.datetime.now(datetime.UTC)])
-            Filer().move_ram_to_shared(path)
-            Filer().move_ram_to_shared(path.replace('json', 'png'))
+            path = os.path.join(self.phase_folder(phase), 'corrections.json')
+            data = orjson.dumps(self.corrections[phase].to_dict(),
+                                option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY)
+            with open(path, 'wb') as fp:
+                fp.write(data)
+            with plotting_lock:
+                plot_phase_corrections(phase=phase, corrections=self.corrections[phase], file=path,
+                                       ends_of_phases=[datetime.datetime.now(datetime.UTC)])
+            self._pending_paths += [path, path.replace('json', 'png')]
+
+    def flush_to_shared(self):
+        """
+        Moves the products accumulated by save_corrections() to the shared area, concurrently
+        """
+        if not self._pending_paths:
+            return
+        paths, self._pending_paths = self._pending_paths, []
+        filer = Filer()
+        futures = [flush_executor.submit(filer.move_ram_to_shared, path) for path in paths]
+        for future in futures:
+            future.result()
 
     def post_process(self):
-        plot_acquisition_corrections(self.folder.replace(Filer().ram.root, Filer().shared.root))
\ No newline at end of file
+        """
+        Moves the remaining products to the shared area and queues the summary plot, without waiting for it
+        """
+        self.flush_to_shared()
+        plotting_executor.submit(self.plot, self.folder.replace(Filer().ram.root, Filer().shared.root))
+
+    @staticmethod
+    def plot(folder: str):
+        try:
+            with plotting_lock:
+                plot_acquisition_corrections(folder)
+        except Exception as ex:
+            logger.error(f"plot: failed to plot acquisition corrections in '{folder}'", exc_info=ex)
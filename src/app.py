@@ -1,15 +1,17 @@
+import asyncio
 import socket
+import sys
+import time
 
 import uvicorn
 from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
 from PlaneWave import pwi4_client
 from common.mast_logging import init_log
 import logging
 from contextlib import asynccontextmanager
 import psutil
 import os
-from fastapi.responses import RedirectResponse, ORJSONResponse
+from fastapi.responses import RedirectResponse, ORJSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from common.process import ensure_process_is_running
 from common.config import Config
@@ -20,10 +22,10 @@ from fastapi import WebSocket, WebSocketDisconnect
 #
 unit_conf = Config().get_unit(socket.gethostname())
 
-# if 'log_level' in unit_conf['global']:
-#     log_level = getattr(logging, unit_conf['global']['log_level'].upper())
-# else:
-log_level = logging.DEBUG
+if 'global' in unit_conf and 'log_level' in unit_conf['global']:
+    log_level = getattr(logging, unit_conf['global']['log_level'].upper())
+else:
+    log_level = logging.WARNING
 logging.basicConfig(level=log_level)
 logger = logging.getLogger('mast.unit.' + __name__)
 init_log(logger)
@@ -40,8 +42,36 @@ if 'https_proxy' in os.environ:
 pw = None
 
 
+def make_job():
+    """
+    Puts this process (and, thereby, all the processes it will start) in a Windows Job Object,
+     so that app_quit() can kill the whole process tree at once.  The job has no kill-on-close limit:
+     if the server exits any other way, PWI4, PWShutter and ps3cli are left running.
+    """
+    try:
+        import win32api
+        import win32con
+        import win32job
+
+        job = win32job.CreateJobObject(None, '')
+        process = win32api.OpenProcess(win32con.PROCESS_SET_QUOTA | win32con.PROCESS_TERMINATE,
+                                       False, os.getpid())
+        win32job.AssignProcessToJobObject(job, process)
+        return job
+    except Exception as ex:
+        logger.warning(f"could not create a job object, will kill children one by one ({ex})")
+        return None
+
+
+job = make_job()
+
+
 def app_quit():
     logger.info('Quiting!')
+    if job is not None:
+        import win32job
+        win32job.TerminateJobObject(job, 1)     # kills this process as well
+
     parent_pid = os.getpid()
     parent = psutil.Process(parent_pid)
     for child in parent.children(recursive=True):  # or parent.children() for recursive=False
@@ -50,50 +80,67 @@ def app_quit():
     parent.kill()
 
 
-ensure_process_is_running(name='PWI4.exe',
-                          cmd='C:\\Program Files (x86)\\PlaneWave Instruments\\PlaneWave Interface 4\\PWI4.exe',
-                          logger=logger, shell=True)
-ensure_process_is_running(name='PWShutter.exe',
-                          cmd="C:\\Program Files (x86)\\PlaneWave Instruments\\" +
-                              "PlaneWave Shutter Control\\PWShutter.exe",
-                          logger=logger,
-                          shell=True)
-
-
-ensure_process_is_running(name='ps3cli.exe',
-                          cwd='C:\\Program Files (x86)\\PlaneWave Instruments\\ps3cli\\ps3cli-2024-09-10',
-                          cmd=f'ps3cli.exe --server --port=8998',
-                          logger=logger,
-                          shell=True,
-                          log_stdout_and_stderr=True)
-
-from camera import router as camera_router
-from covers import router as covers_router
-from mount import router as mount_router
-from focuser import router as focuser_router
-from stage import router as stage_router
-from unit import router as unit_router
-from unit import unit
-
-while True:
+# one scan of the process table, ensure_process_is_running() is called only for the missing ones
+running_process_names = {p.info['name'] for p in psutil.process_iter(['name'])}
+required_processes = [
+    dict(name='PWI4.exe',
+         cmd='C:\\Program Files (x86)\\PlaneWave Instruments\\PlaneWave Interface 4\\PWI4.exe',
+         logger=logger, shell=True),
+    dict(name='PWShutter.exe',
+         cmd="C:\\Program Files (x86)\\PlaneWave Instruments\\" +
+             "PlaneWave Shutter Control\\PWShutter.exe",
+         logger=logger,
+         shell=True),
+    dict(name='ps3cli.exe',
+         cwd='C:\\Program Files (x86)\\PlaneWave Instruments\\ps3cli\\ps3cli-2024-09-10',
+         cmd=f'ps3cli.exe --server --port=8998',
+         logger=logger,
+         shell=True,
+         log_stdout_and_stderr=True),
+]
+for required in required_processes:
+    if required['name'] not in running_process_names:
+        ensure_process_is_running(**required)
+
+PWI4_CONNECT_INTERVAL_SECONDS = 0.25
+PWI4_CONNECT_MAX_ATTEMPTS = 240     # one minute
+
+for attempt in range(PWI4_CONNECT_MAX_ATTEMPTS):
     try:
         pw = pwi4_client.PWI4()
         pw.status()
         logger.info(f"Connected to PWI4")
         break
     except pwi4_client.PWException as ex:
-        logger.info(f"no PWI4 yet ...")
-        continue
+        if attempt % 20 == 0:
+            logger.info(f"no PWI4 yet ...")
+        time.sleep(PWI4_CONNECT_INTERVAL_SECONDS)
     except Exception as ex:
         logger.error("cannot connect to PWI4", exc_info=ex)
         app_quit()
+else:
+    logger.error(f"PWI4 did not respond within {PWI4_CONNECT_MAX_ATTEMPTS * PWI4_CONNECT_INTERVAL_SECONDS} seconds")
+    app_quit()
+
+#
+# The device modules create their (singleton) drivers at import time and some of them
+#  (mount, focuser) talk to PWI4 right away, so they are imported only once PWI4 responds
+#
+from camera import router as camera_router
+from covers import router as covers_router
+from mount import router as mount_router
+from focuser import router as focuser_router
+from stage import router as stage_router
+from unit import router as unit_router
+from unit import unit
 
 
 @asynccontextmanager
 async def lifespan(fast_app: FastAPI):
-    unit.start_lifespan()
+    # the unit's startup/shutdown talk to the hardware, run them off the event loop
+    await asyncio.to_thread(unit.start_lifespan)
     yield
-    unit.end_lifespan()
+    await asyncio.to_thread(unit.end_lifespan)
 
 
 async def websocket_disconnect_handler(websocket: WebSocket, exc: WebSocketDisconnect):
@@ -106,7 +153,7 @@ app = FastAPI(
     redocs_url=None,
     lifespan=lifespan,
     openapi_url='/openapi.json',
-    debug=True,
+    debug=os.getenv('MAST_DEBUG') == '1',
     default_response_class=ORJSONResponse,
     # exception_handlers={WebSocketDisconnect: websocket_disconnect_handler},
 )
@@ -116,13 +163,63 @@ app = FastAPI(
 # logger = logging.getLogger("uvicorn.protocols.websockets.websockets_impl.WebSocketProtocol")
 # logger.setLevel(logging.DEBUG)
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+
+class AllowAnyOriginMiddleware:
+    """
+    A minimal replacement for Starlette's CORSMiddleware (allow_origins=["*"], allow_credentials=True):
+     every origin is allowed, so there is no per-request origin matching.  As with CORSMiddleware,
+     only requests with an Origin header get the CORS headers.  The origin is echoed (rather than '*'),
+     since browsers reject a wildcard origin on credentialed requests, so the responses vary on Origin.
+     Preflights (OPTIONS with Origin and Access-Control-Request-Method) are answered right here,
+     any other OPTIONS request goes to the app.
+    """
+
+    cors_headers = [
+        (b'access-control-allow-credentials', b'true'),
+        (b'vary', b'Origin'),
+    ]
+    preflight_headers = [
+        (b'access-control-allow-credentials', b'true'),
+        (b'access-control-allow-methods', b'DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT'),
+        (b'access-control-max-age', b'600'),
+        (b'vary', b'Origin'),
+        (b'content-length', b'0'),
+    ]
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = dict(scope['headers'])
+        origin = request_headers.get(b'origin')
+        if origin is None:     # not a cross-origin request
+            await self.app(scope, receive, send)
+            return
+
+        if scope['method'] == 'OPTIONS' and b'access-control-request-method' in request_headers:
+            headers = [(b'access-control-allow-origin', origin)] + self.preflight_headers
+            if b'access-control-request-headers' in request_headers:
+                headers.append((b'access-control-allow-headers',
+                                request_headers[b'access-control-request-headers']))
+            await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        cors_headers = [(b'access-control-allow-origin', origin)] + self.cors_headers
+
+        async def send_with_cors(message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = list(message.get('headers', [])) + cors_headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
+
+
+app.add_middleware(AllowAnyOriginMiddleware)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 
@@ -142,9 +239,20 @@ app.include_router(stage_router)
 app.include_router(camera_router)
 
 
-@app.get("/favicon.ico")
+# the favicon is requested by every browser tab, serve it from memory rather than redirecting to /static
+try:
+    with open(os.path.join('static', 'favicon.ico'), 'rb') as favicon_file:
+        favicon_bytes: bytes | None = favicon_file.read()
+except OSError:
+    favicon_bytes = None
+
+
+@app.get("/favicon.ico", include_in_schema=False)
 def read_favicon():
-    return RedirectResponse(url="/static/favicon.ico")
+    if favicon_bytes is None:
+        return RedirectResponse(url="/static/favicon.ico")
+    return Response(content=favicon_bytes, media_type='image/x-icon',
+                    headers={'Cache-Control': 'max-age=86400'})
 
 
 if __name__ == "__main__":
@@ -154,4 +262,6 @@ if __name__ == "__main__":
 
     logger.info("The MAST Unit server is starting ...")
 
-    uvicorn.run(app, host=host, port=port, log_level=log_level)
+    # uvloop does not support Windows, where the unit normally runs
+    loop = 'asyncio' if sys.platform == 'win32' else 'uvloop'
+    uvicorn.run(app, host=host, port=port, log_level=log_level, loop=loop, http='httptools')
@@ -0,0 +1,90 @@
+import io
+import logging
+import queue
+from threading import Thread
+from typing import Callable, Optional
+
+import numpy as np
+from astropy.io import fits
+
+from common.mast_logging import init_log
+from common.utils import function_name
+
+logger = logging.getLogger('mast.unit.' + __name__)
+init_log(logger)
+
+
+class AsyncFrameWriter:
+    """
+    Writes FITS frames to disk from a single, long-lived, background thread.
+
+    Frames are queued by ``write()`` (which returns immediately), so the next exposure
+     does not wait for the previous one to reach the disk.  ``flush()`` waits for all
+     the queued frames to be written.
+    """
+
+    _instance = None
+    _initialized = False
+
+    DEFAULT_MAX_QUEUED_FRAMES: int = 8
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super(AsyncFrameWriter, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self, max_queued_frames: int = DEFAULT_MAX_QUEUED_FRAMES):
+        if self._initialized:
+            return
+
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queued_frames)
+        self.thread: Thread = Thread(name='frame-writer-thread', target=self.run, daemon=True)
+        self.thread.start()
+
+        self._initialized = True
+
+    def write(self, path: str, data: np.ndarray, header: fits.Header,
+              on_done: Optional[Callable[[Optional[Exception]], None]] = None):
+        """
+        Queues a frame for writing.  Blocks only if max_queued_frames are already waiting.
+
+        :param path: The FITS file path
+        :param data: The image data, must not be modified by the caller once queued
+        :param header: The FITS header
+        :param on_done: Called (from the writer thread) once the write ended, with the exception if it failed,
+         None if it succeeded
+        """
+        self.queue.put((path, data, header, on_done))
+
+    def flush(self):
+        """
+        Waits until all the queued frames were written
+        """
+        self.queue.join()
+
+    def run(self):
+        op = function_name()
+
+        while True:
+            path, data, header, on_done = self.queue.get()
+            error = None
+            try:
+                logger.info(f'{op}: saving image to {path} ...')
+                # astropy issues many small writes (header cards, padding), render the file in memory
+                #  and hand it to the filesystem in one write
+                buffer = io.BytesIO()
+                # CHECKSUM/DATASUM are kept, this thread is already off the exposure path.  A header card
+                #  astropy would reject is fixed (with a warning), rather than losing the frame.
+                fits.PrimaryHDU(data=data, header=header).writeto(buffer, checksum=True, output_verify='fix+warn')
+                with open(path, 'wb') as f:
+                    f.write(buffer.getbuffer())
+            except Exception as ex:
+                logger.error(f"{op}: failed to save image to {path}", exc_info=ex)
+                error = ex
+            finally:
+                if on_done:
+                    try:
+                        on_done(error)
+                    except Exception as ex:
+                        logger.error(f"{op}: on_done callback failed for {path}", exc_info=ex)
+                self.queue.task_done()
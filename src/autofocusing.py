@@ -1,5 +1,4 @@
-import datetime
-from threading import Thread
+from threading import Thread, Event
 from common.utils import function_name, CanonicalResponse_Ok
 from common.paths import PathMaker
 from common.mast_logging import init_log
@@ -12,15 +11,42 @@ from typing import List, Optional
 from PlaneWave.ps3cli_client import PS3CLIClient
 from camera import CameraSettings, CameraBinning
 from stage import StagePresetPosition
-from common.activities import UnitActivities, FocuserActivities
+from common.activities import UnitActivities
 from common.utils import UnitRoi
 from common.extended_basemodel import ExtendedBaseModel
 from plotting import plot_autofocus_analysis
+from acquisition import plotting_lock
+from async_writer import AsyncFrameWriter
 import math
+import socket
+import copy
+from concurrent.futures import ThreadPoolExecutor, Future
 
 logger = logging.getLogger('mast.unit.' + __name__)
 init_log(logger)
 
+# moves the autofocus products to the shared area (and plots them), so the next try does not wait for it
+products_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='autofocus-products')
+
+
+def submit_product(func, *args) -> Future:
+    """
+    Queues a products job.  Nobody waits on the returned Future, so its failure is logged when it completes.
+    """
+    def log_failure(future: Future):
+        if future.exception() is not None:
+            logger.error(f"products job {func.__name__} failed", exc_info=future.exception())
+
+    future = products_executor.submit(func, *args)
+    future.add_done_callback(log_failure)
+    return future
+
+
+def plot_autofocus_products(result: 'PS3FocusAnalysisResult', folder: str, pixel_scale: float):
+    # matplotlib's pyplot is not thread-safe, the acquisition plotter may be drawing at the same time
+    with plotting_lock:
+        plot_autofocus_analysis(result, folder, pixel_scale)
+
 
 class AutofocusResult:
     success: bool
@@ -56,9 +82,25 @@ class PS3AutofocusStatus(ExtendedBaseModel):
 
 
 class Autofocuser:
-    
+
+    MAX_MOTION_SECONDS: float = 180
+
+    PS3_HOST: str = '127.0.0.1'
+    PS3_PORT: int = 8998
+
+    # the analyser's status is polled with an exponential backoff
+    ANALYSIS_POLL_MIN_SECONDS: float = 0.05
+    ANALYSIS_POLL_MAX_SECONDS: float = 2
+    ANALYSIS_POLL_BACKOFF: float = 1.5
+    # the analyser's time budget grows with the number of images, but is never below the minimum
+    ANALYSIS_MIN_TIMEOUT_SECONDS: float = 60
+    ANALYSIS_SECONDS_PER_IMAGE: float = 6
+
     def __init__(self, unit: 'Unit'):
         self.unit: 'Unit' = unit
+        self.wis_stopped: Event = Event()   # set by stop_autofocus(), checked between the WIS autofocus steps
+        # kept connected across tries and runs, closed when the unit shuts down
+        self.ps3_client: PS3CLIClient = PS3CLIClient()
 
     @property
     def is_autofocusing(self) -> bool:
@@ -135,6 +177,7 @@ class Autofocuser:
         op = function_name()
         self.unit.errors = []
 
+        self.wis_stopped.clear()
         self.unit.start_activity(UnitActivities.AutofocusingWIS)
 
         self.unit.stage.move_to_preset(StagePresetPosition.Sky)
@@ -152,127 +195,133 @@ class Autofocuser:
 
         if not start_position:
             start_position = self.unit.unit_conf['focuser']['known_as_good_position']
-        focuser_position: int = int(start_position - ((number_of_images / 2) * ticks_per_step))
+        focuser_position: int = int(start_position) - (number_of_images * ticks_per_step) // 2
         self.unit.focuser.position = focuser_position
 
         logger.debug(f"{op}: Waiting for components (stage, mount, focuser) to stop moving ...")
-        while (self.unit.stage.is_moving or
-               self.unit.mount.is_slewing or
-               self.unit.focuser.is_active(FocuserActivities.Moving)):
-            time.sleep(.5)
+        still_moving = self.unit.wait_until_idle(timeout=Autofocuser.MAX_MOTION_SECONDS)
+        if still_moving:
+            logger.warning(f"{op}: {still_moving} did not stop moving within {Autofocuser.MAX_MOTION_SECONDS} seconds")
         logger.debug(f"{op}: Components (stage, mount, focuser) stopped moving ...")
-        if not self.unit.is_active(UnitActivities.AutofocusingWIS):
+        if self.wis_stopped.is_set():
             logger.info("activity 'AutofocusingWIS' was stopped")
             return
 
         acquisition_conf: dict = self.unit.unit_conf['acquisition']
-        unit_roi = UnitRoi(
-            acquisition_conf['roi']['fiber_x'],
-            acquisition_conf['roi']['fiber_y'],
-            acquisition_conf['roi']['width'],
-            acquisition_conf['roi']['height'],
-        )
-        _binning = CameraBinning(1, 1)
+        autofocus_conf: dict = self.unit.unit_conf['autofocus']
 
-        max_tries: int = self.unit.unit_conf['autofocus']['max_tries']
-        max_tolerance: float = self.unit.unit_conf['autofocus']['max_tolerance']
+        max_tries: int = autofocus_conf['max_tries']
+        max_tolerance: float = autofocus_conf['max_tolerance']
+        analysis_seconds_per_image: float = autofocus_conf['analysis_seconds_per_image'] \
+            if 'analysis_seconds_per_image' in autofocus_conf else Autofocuser.ANALYSIS_SECONDS_PER_IMAGE
         try_number: int = 0
 
         for try_number in range(max_tries):
 
             logger.info(f"{op}: starting autofocus try #{try_number} (of {max_tries})")
+            if not self.unit.focuser.wait_until_idle(timeout=Autofocuser.MAX_MOTION_SECONDS):
+                logger.warning(f"{op}: focuser did not stop moving within {Autofocuser.MAX_MOTION_SECONDS} seconds")
             autofocus_folder = PathMaker().make_autofocus_folder()
+            # each try has its own folder, made by the settings' constructor.  Within the try
+            #  only the image_path changes between the exposures
+            autofocus_settings: CameraSettings = \
+                Autofocuser.make_autofocus_settings(exposure, acquisition_conf, autofocus_folder)
             #
             # Acquire images
             #
-            files: List[str] = []
+            files: List[Optional[str]] = [None] * number_of_images
+            saved: List[Optional[Future]] = [None] * number_of_images
+            file_prefix = os.path.join(autofocus_folder, 'FOCUS')
             for image_no in range(number_of_images):
-                autofocus_settings = CameraSettings(
-                    seconds=exposure,
-                    binning=_binning,
-                    roi=unit_roi.to_camera_roi(binning=_binning),
-                    gain=acquisition_conf['gain'],
-                    image_path=os.path.join(autofocus_folder, f"FOCUS{int(focuser_position):05}.fits"),
-                    save=True,
-                )
+                autofocus_settings.image_path = f"{file_prefix}{focuser_position:05}.fits"
 
                 logger.info(f"{op}: starting exposure #{image_no} of {number_of_images} at {focuser_position=} ...")
+                # returns once the image was read out, the file is written in the background (AsyncFrameWriter)
+                #  while the focuser moves to the next position and the next exposure is taken
+                autofocus_settings.saved = None     # stays None if the exposure does not start
                 self.unit.camera.do_start_exposure(autofocus_settings)
-                logger.info(f"{op}: waiting for exposure #{image_no} of {number_of_images} ...")
-                self.unit.camera.wait_for_image_saved()
-                files.append(self.unit.camera.latest_settings.image_path)
-                if not self.unit.is_active(UnitActivities.AutofocusingWIS):  # have we been stopped?
+                files[image_no] = autofocus_settings.image_path
+                saved[image_no] = autofocus_settings.saved
+                if self.wis_stopped.is_set():  # have we been stopped?
                     logger.info(f"{op}: activity 'AutofocusingWIS' was stopped")
                     return
 
                 focuser_position += ticks_per_step
                 logger.info(f"{op}: moving focuser by {ticks_per_step} ticks (to {focuser_position}) ...")
                 self.unit.focuser.position = focuser_position
-                while self.unit.focuser.is_active(FocuserActivities.Moving):
-                    time.sleep(.5)
+                if image_no == number_of_images - 1:
+                    break   # no more exposures in this try, let the analysis run while the focuser moves
+                if not self.unit.focuser.wait_until_idle(timeout=Autofocuser.MAX_MOTION_SECONDS):
+                    logger.warning(f"{op}: focuser did not stop moving within {Autofocuser.MAX_MOTION_SECONDS} seconds")
                 logger.info(f"{op}: focuser stopped moving")
 
-                if not self.unit.is_active(UnitActivities.AutofocusingWIS):  # have we been stopped?
+                if self.wis_stopped.is_set():  # have we been stopped?
                     logger.info(f"{op}: activity 'AutofocusingWIS' was stopped")
                     return
 
-            # The files are now on the RAM disk
+            logger.info(f"{op}: waiting for the images to be saved ...")
+            AsyncFrameWriter().flush()
+            # The files are now on the RAM disk, unless their exposure or write failed
+            missing = [files[i] for i, future in enumerate(saved)
+                       if future is None or future.exception() is not None or future.result() is None]
+            if missing:
+                self.log_and_store_error(f"{op}: {len(missing)} image(s) were not saved: {missing}")
+                submit_product(Filer().move_ram_to_shared, autofocus_folder)
+                continue  # next try_number
 
             self.unit.start_activity(UnitActivities.AutofocusAnalysis)
-            ps3_client = PS3CLIClient()
-            ps3_client.connect('127.0.0.1', 8998)
-            ps3_client.begin_analyze_focus(files)
-
-            status: PS3AutofocusStatus | None = None
-            timeout = 60
-            start = datetime.datetime.now()
-            end = start + datetime.timedelta(seconds=timeout)
-            while datetime.datetime.now() < end:
+            self.begin_analyze_focus(files)
+
+            timeout = max(Autofocuser.ANALYSIS_MIN_TIMEOUT_SECONDS, analysis_seconds_per_image * number_of_images)
+            deadline = time.monotonic() + timeout
+            poll_seconds = Autofocuser.ANALYSIS_POLL_MIN_SECONDS
+            while time.monotonic() < deadline:
                 # wait for the autofocus analyser to start running
-                d = ps3_client.focus_status()
-                if d is None:
-                    time.sleep(.1)
-                    continue
-                status = PS3AutofocusStatus(**d)
-                if not status.is_running:
-                    time.sleep(.1)
-                else:
+                d = self.focus_status()
+                if d is not None and d.get('is_running', False):
                     break
-            if datetime.datetime.now() >= end:
+                time.sleep(poll_seconds)
+                poll_seconds = min(poll_seconds * Autofocuser.ANALYSIS_POLL_BACKOFF,
+                                   Autofocuser.ANALYSIS_POLL_MAX_SECONDS)
+            if time.monotonic() >= deadline:
                 self.log_and_store_error(f"{op}: autofocus analyser did not start within {timeout} seconds")
-                Filer().move_ram_to_shared(autofocus_folder)
+                self.ps3_client.close()     # a late reply must not be read as the answer to the next request
+                submit_product(Filer().move_ram_to_shared, autofocus_folder)
                 self.unit.end_activity(UnitActivities.AutofocusAnalysis)
                 self.unit.end_activity(UnitActivities.AutofocusingWIS)
                 return
 
-            while datetime.datetime.now() < end:
+            poll_seconds = Autofocuser.ANALYSIS_POLL_MIN_SECONDS
+            while time.monotonic() < deadline:
                 # wait for the autofocus analyser to stop running
-                s = ps3_client.focus_status()
-                status: PS3AutofocusStatus = PS3AutofocusStatus(**s)
+                # only is_running is needed while polling, the full status is parsed once the analyser stops
+                s = self.focus_status()
                 logger.info(f"{op}: {s=}")
-                if not status.is_running:
+                if s is not None and not s.get('is_running', False):
                     break
                 else:
-                    time.sleep(.5)
+                    time.sleep(poll_seconds)
+                    poll_seconds = min(poll_seconds * Autofocuser.ANALYSIS_POLL_BACKOFF,
+                                       Autofocuser.ANALYSIS_POLL_MAX_SECONDS)
 
-            if datetime.datetime.now() >= end:
+            if time.monotonic() >= deadline:
                 self.log_and_store_error(f"{op}: autofocus analyser did not finish within {timeout} seconds")
-                ps3_client.close()
-                Filer().move_ram_to_shared(autofocus_folder)
+                self.ps3_client.close()     # a late reply must not be read as the answer to the next request
+                submit_product(Filer().move_ram_to_shared, autofocus_folder)
                 self.unit.end_activity(UnitActivities.AutofocusAnalysis)
                 continue  # next try_number
 
-            ps3_client.close()
             self.unit.end_activity(UnitActivities.AutofocusAnalysis)
 
+            status: PS3AutofocusStatus = PS3AutofocusStatus(**s)
             if not status.analysis_result:
                 self.log_and_store_error(f"{op}: focus analyser stopped working but empty analysis_result")
-                Filer().move_ram_to_shared(autofocus_folder)
+                submit_product(Filer().move_ram_to_shared, autofocus_folder)
                 continue  # next try_number
 
             if not status.analysis_result.has_solution:
                 self.log_and_store_error(f"{op}: focus analyser did not find a solution")
-                Filer().move_ram_to_shared(autofocus_folder)
+                submit_product(Filer().move_ram_to_shared, autofocus_folder)
                 continue  # next try_number
 
             #
@@ -288,28 +337,23 @@ class Autofocuser:
                 continue  # next try_number
 
             position: int = int(result.best_focus_position)
+            self.unit.focuser.wait_until_idle(timeout=Autofocuser.MAX_MOTION_SECONDS)
             logger.info(f"{op}: moving focuser to best focus position {position} ...")
             self.unit.focuser.known_as_good_position = position
             self.unit.focuser.position = self.unit.focuser.known_as_good_position
 
             logger.info(f"{op}: waiting for focuser to stop moving ...")
-            while self.unit.focuser.is_active(FocuserActivities.Moving):
-                time.sleep(.5)
+            if not self.unit.focuser.wait_until_idle(timeout=Autofocuser.MAX_MOTION_SECONDS):
+                logger.warning(f"{op}: focuser did not stop moving within {Autofocuser.MAX_MOTION_SECONDS} seconds")
             logger.info(f"{op}: focuser stopped moving")
 
             self.unit.unit_conf['focuser']['known_as_good_position'] = position
-            try:
-                Config().set_unit(self.unit.hostname, self.unit.unit_conf)
-                logger.info(f"saved unit '{self.unit.hostname}' configuration for " +
-                            f"focuser known-as-good-position {position}")
-            except Exception as e:
-                self.log_and_store_error(f"could not save unit '{self.unit.hostname}' " +
-                                         f"configuration for focuser known-as-good-position (exception: {e})")
-
-            Filer().move_ram_to_shared(autofocus_folder)
+            # a snapshot is saved in the background, later changes to unit_conf don't race with the write
+            submit_product(self.save_known_as_good_position, copy.deepcopy(self.unit.unit_conf), position)
+
+            submit_product(Filer().move_ram_to_shared, autofocus_folder)
             pixel_scale: float = self.unit.unit_conf['camera']['pixel_scale_at_bin1']
-            Thread(name='autofocus-analysis-plotter', target=plot_autofocus_analysis,
-                   args=[result, autofocus_folder, pixel_scale]).start()
+            submit_product(plot_autofocus_products, result, autofocus_folder, pixel_scale)
 
             break  # the tries loop
 
@@ -364,9 +408,109 @@ class Autofocuser:
             return CanonicalResponse_Ok
 
         elif self.unit.is_active(UnitActivities.AutofocusingWIS):
+            self.wis_stopped.set()
             self.unit.end_activity(UnitActivities.AutofocusingWIS)
             return CanonicalResponse_Ok
 
+    @staticmethod
+    def make_autofocus_settings(exposure: float, acquisition_conf: dict, folder: str) -> CameraSettings:
+        """
+        Makes the camera settings for the autofocus exposures: unbinned, the acquisition's ROI and gain
+
+        :param exposure: Exposure duration in seconds
+        :param acquisition_conf: The unit's 'acquisition' configuration
+        :param folder: The autofocus folder, the exposures set their own image_path
+        """
+        roi_conf: dict = acquisition_conf['roi']
+        unit_roi = UnitRoi(
+            roi_conf['fiber_x'],
+            roi_conf['fiber_y'],
+            roi_conf['width'],
+            roi_conf['height'],
+        )
+        binning = CameraBinning(1, 1)
+        return CameraSettings(
+            seconds=exposure,
+            binning=binning,
+            roi=unit_roi.to_camera_roi(binning=binning),
+            gain=acquisition_conf['gain'],
+            base_folder=folder,
+            save=True,
+        )
+
+    def begin_analyze_focus(self, files: List[str]):
+        """
+        Hands the files to the PS3 focus analyser over the persistent connection.  A connection
+         that was dropped (e.g. ps3cli was restarted) is re-established once.  After any other
+         failure the connection is closed, it may hold part of a reply.
+        """
+        self.reconnect_ps3_if_dead()
+        try:
+            self.ps3_client.begin_analyze_focus(files)
+        except ConnectionError as ex:
+            logger.info(f"begin_analyze_focus: PS3 connection is dead ({ex}), reconnecting ...")
+            self.ps3_client.close()
+            self.ps3_client.connect(Autofocuser.PS3_HOST, Autofocuser.PS3_PORT)
+            try:
+                self.ps3_client.begin_analyze_focus(files)
+            except Exception:
+                self.ps3_client.close()
+                raise
+        except Exception:
+            self.ps3_client.close()
+            raise
+
+    def focus_status(self) -> dict | None:
+        """
+        Polls the PS3 focus analyser.  A failed poll closes the connection (it may hold part of
+         a reply), the next poll reconnects.
+
+        :return: The analyser's status, None if it could not be polled
+        """
+        try:
+            self.reconnect_ps3_if_dead()
+            return self.ps3_client.focus_status()
+        except Exception as ex:
+            logger.warning(f"focus_status: PS3 poll failed ({ex}), will reconnect")
+            self.ps3_client.close()
+            return None
+
+    def reconnect_ps3_if_dead(self):
+        """
+        (Re)connects the PS3 client unless it holds a live, idle, connection.  A connection closed by
+         the server is detected by peeking for EOF, since the client would otherwise spin on empty reads.
+         Unread bytes are leftovers of a reply we gave up on, the connection is replaced rather than
+         have them parsed as the answer to the next request.
+        """
+        sock = self.ps3_client.sock
+        if sock is not None:
+            try:
+                sock.setblocking(False)
+                sock.recv(1, socket.MSG_PEEK)
+                alive = False   # EOF or stale data
+            except BlockingIOError:
+                alive = True    # nothing to read, the connection is idle
+            except OSError:
+                alive = False
+            finally:
+                sock.settimeout(1)  # as set by PS3CLIClient.connect()
+            if alive:
+                return
+            self.ps3_client.close()
+        self.ps3_client.connect(Autofocuser.PS3_HOST, Autofocuser.PS3_PORT)
+
+    def close(self):
+        self.ps3_client.close()
+
+    def save_known_as_good_position(self, unit_conf: dict, position: int):
+        try:
+            Config().set_unit(self.unit.hostname, unit_conf)
+            logger.info(f"saved unit '{self.unit.hostname}' configuration for " +
+                        f"focuser known-as-good-position {position}")
+        except Exception as e:
+            self.log_and_store_error(f"could not save unit '{self.unit.hostname}' " +
+                                     f"configuration for focuser known-as-good-position (exception: {e})")
+
     def log_and_store_error(self, message: str):
         logger.error(message)
         self.unit.errors.append(message)
@@ -1,15 +1,18 @@
 import datetime
 import os
+import queue
 import socket
 import threading
 import time
 from logging import Logger
 
 import win32com.client
+import pythoncom
 from typing import List, Callable
 import logging
 from enum import IntFlag, auto, Enum
 from threading import Thread, Lock
+from concurrent.futures import Future
 
 from common.utils import RepeatTimer, time_stamp, BASE_UNIT_PATH, OperatingMode
 from common.utils import Component, CanonicalResponse, CanonicalResponse_Ok, function_name
@@ -19,20 +22,45 @@ from common.camera import CameraRoi, CameraBinning
 from common.mast_logging import init_log
 from dlipower.dlipower.dlipower import SwitchedPowerDevice
 
-from fastapi.routing import APIRouter
+from mastapi import MastapiRouter
 from astropy.io import fits
 import numpy as np
 from common.ascom import ascom_run, AscomDispatcher
 from common.activities import CameraActivities
+from async_writer import AsyncFrameWriter
 
 logger = logging.getLogger('mast.unit.' + __name__)
 init_log(logger)
 
+hostname = socket.gethostname()
+
 
 class Visualizer:
+    """
+    A consumer of the camera's images, fed through its own long-lived thread.  Only the latest image
+     is kept, so a slow visualizer skips images rather than holding up the readout.
+    """
     def __init__(self, name: str, func: Callable):
         self.name = name
         self.func = func
+        self.queue: queue.Queue = queue.Queue(maxsize=1)
+        self.thread: Thread = Thread(name=name, target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, image: np.ndarray):
+        try:
+            self.queue.get_nowait()     # drop the previous image, if not yet visualized
+        except queue.Empty:
+            pass
+        self.queue.put_nowait(image)
+
+    def run(self):
+        while True:
+            image = self.queue.get()
+            try:
+                self.func(image)
+            except Exception as ex:
+                logger.error(f"visualizer '{self.name}' failed", exc_info=ex)
 
 
 class AscomCameraState(IntFlag):
@@ -66,7 +94,9 @@ class CameraSettings:
     After start_exposure() is called:
     - image_path - contains the full path to the saved file, with a standard combination of the context elements
                <folder>/seq=<sequence>,tags=<tag1=value1,tag2,tag3=value3>,binning=<binning>,gain=<gain>,roi=<roi>
+               (made on first access, when only base_folder was supplied)
     - start - contains the exposure start time
+    - saved - a Future, resolved (with image_path) once the image was written to disk
 
     Note:
      start_exposure() will copy the context to camera.latest_settings thus making it available for further use
@@ -86,7 +116,7 @@ class CameraSettings:
 
         self.seconds: float = seconds
         self.base_folder: str | None = base_folder
-        self.image_path: str | None = image_path
+        self._image_path: str | None = image_path
         self.binning: CameraBinning | None = binning
         self.gain: float | None = gain
         self.roi: CameraRoi | None = roi
@@ -95,17 +125,28 @@ class CameraSettings:
         self.fits_cards: dict | None = fits_cards
         self.start: datetime.datetime = datetime.datetime.now()
         self.file_name_parts: List[str] = []
+        self.saved: Future | None = None
 
         if self.save:
-            if self.image_path is not None:
-                os.makedirs(os.path.dirname(self.image_path), exist_ok=True)
+            if self._image_path is not None:
+                os.makedirs(os.path.dirname(self._image_path), exist_ok=True)
             elif self.base_folder is not None:
                 self.folder = self.base_folder
                 os.makedirs(self.folder, exist_ok=True)
-                self.make_file_name()
+                # the file name (seq= needs a folder scan) is made when image_path is first needed
             else:
                 raise Exception(f"CameraSettings:__init__(): either 'image_path' or 'base_folder' MUST be supplied")
 
+    @property
+    def image_path(self) -> str | None:
+        if self._image_path is None and self.save and self.base_folder is not None:
+            self.make_file_name()
+        return self._image_path
+
+    @image_path.setter
+    def image_path(self, value: str | None):
+        self._image_path = value
+
     def make_file_name(self, additional_tags: dict | None = None):
         """
         Makes the file part of the image path.  This will:
@@ -115,22 +156,21 @@ class CameraSettings:
         :param additional_tags: tags specific to THIS making of the file name
         :return:
         """
-        self.file_name_parts = []
-        self.file_name_parts.append(f"seq={PathMaker().make_seq(self.folder, start_with=-1)}")
-        self.file_name_parts.append(f"time={PathMaker().current_utc()}")
-
-        tags = {}
-        if additional_tags:
-            tags = additional_tags
-        if self.tags:
-            tags.update(self.tags)
-        for k, v in tags.items():
-            self.file_name_parts.append(f"{k}" if v is None else f"{k}={v}")
-
-        self.file_name_parts.append(f"seconds={self.seconds}")
-        self.file_name_parts.append(f"binning={self.binning}")
-        self.file_name_parts.append(f"gain={self.gain}")
-        self.file_name_parts.append(f"roi={self.roi}")
+        path_maker = PathMaker()
+        tags = additional_tags | self.tags if additional_tags else self.tags
+
+        self.file_name_parts = [
+            f"seq={path_maker.make_seq(self.folder, start_with=-1)}",
+            f"time={path_maker.current_utc()}",
+        ]
+        if tags:
+            self.file_name_parts += [f"{k}" if v is None else f"{k}={v}" for k, v in tags.items()]
+        self.file_name_parts += [
+            f"seconds={self.seconds}",
+            f"binning={self.binning}",
+            f"gain={self.gain}",
+            f"roi={self.roi}",
+        ]
 
         self.image_path = os.path.join(self.folder, ','.join(self.file_name_parts) + '.fits')
 
@@ -139,6 +179,18 @@ class Camera(Component, SwitchedPowerDevice, AscomDispatcher):
     _instance = None
     _initialized = False
 
+    # the readout worker wakes up this long before the exposure's end, then polls ImageReady
+    READOUT_LEAD_SECONDS: float = 0.2
+    READOUT_POLL_SECONDS: float = 0.02
+    READOUT_TIMEOUT_SECONDS: float = 60
+    # the timer polls the camera (over COM) less often while it is idle
+    TIMER_BUSY_SECONDS: float = 1
+    TIMER_IDLE_SECONDS: float = 5
+    BUSY_ACTIVITIES = (CameraActivities.Exposing, CameraActivities.ReadingOut,
+                       CameraActivities.CoolingDown, CameraActivities.WarmingUp)
+    # status/operational checks arrive in bursts, they may share ASCOM property reads this fresh
+    ASCOM_CACHE_SECONDS: float = 0.2
+
     def __new__(cls, *args, **kwargs):
         if cls._instance is None:
             cls._instance = super(Camera, cls).__new__(cls)
@@ -182,7 +234,10 @@ class Camera(Component, SwitchedPowerDevice, AscomDispatcher):
             raise ex
 
         self.latest_settings: None | CameraSettings = None
-        self.latest_temperature_check: datetime.datetime | None = None
+        self.dispids: dict[str, int] = {}   # ASCOM property name -> DISPID, see get_ascom_properties()
+        self.ascom_cache: dict[str, tuple] = {}     # ASCOM property name -> (value, time.monotonic())
+        self.latest_temperature_check: float | None = None     # time.monotonic() of the latest refresh_thermal()
+        self.thermal: dict = {}
         self.temp_check_interval = self.conf['temp_check_interval'] \
             if 'temp_check_interval' in self.conf else self.defaults['temp_check_interval']
 
@@ -200,6 +255,7 @@ class Camera(Component, SwitchedPowerDevice, AscomDispatcher):
         self.GainMin: float | None = None
         self.GainMax: float | None = None
         self.image: np.ndarray | None = None
+        self.image_dtype: type = np.int32  # in memory only, narrowed to np.uint16 on connect, if MaxADU allows
         self.last_state: AscomCameraState = AscomCameraState.Idle
         self.errors: List[str] = []
         self.expected_mid_exposure: datetime.datetime | None = None
@@ -210,7 +266,7 @@ class Camera(Component, SwitchedPowerDevice, AscomDispatcher):
         
         self._was_shut_down: bool = False
 
-        self.timer: RepeatTimer = RepeatTimer(1, function=self.ontimer)
+        self.timer: RepeatTimer = RepeatTimer(Camera.TIMER_IDLE_SECONDS, function=self.ontimer)
         self.timer.name = 'camera-timer-thread'
         self.timer.start()
 
@@ -222,7 +278,13 @@ class Camera(Component, SwitchedPowerDevice, AscomDispatcher):
         self.visualizers: List[Visualizer] = []
 
         self.image_ready_event: threading.Event = threading.Event()
-        self.image_saved_event: threading.Event = threading.Event()
+
+        # one long-lived readout worker, handed the duration of each exposure it should follow
+        self.readout_queue: queue.Queue = queue.Queue()
+        self.readout_thread: Thread = Thread(name='camera-readout', target=self.readout_worker, daemon=True)
+        self.readout_thread.start()
+
+        self.prepared_settings: CameraSettings | None = None
 
         self.guiding_roi_width: int | None = None
         self.guiding_roi_height: int | None = None
@@ -236,18 +298,20 @@ class Camera(Component, SwitchedPowerDevice, AscomDispatcher):
 
     @binning.setter
     def binning(self, value: CameraBinning):
-        if 1 > value.x > self.maxBinX:
-            raise Exception(f'bad {value.x=}, must be > 1 and < {self.maxBinX=}')
-        if 1 > value.y > self.maxBinY:
-            raise Exception(f'bad {value.y=}, must be > 1 and < {self.maxBinY=}')
+        if self.maxBinX is not None and not (1 <= value.x <= self.maxBinX):
+            raise Exception(f'bad {value.x=}, must be >= 1 and <= {self.maxBinX=}')
+        if self.maxBinY is not None and not (1 <= value.y <= self.maxBinY):
+            raise Exception(f'bad {value.y=}, must be >= 1 and <= {self.maxBinY=}')
 
         current_binning = self._binning
-        response_x = ascom_run(self, f'BinX = {value.x}')
-        response_y = ascom_run(self, f'BinY = {value.y}')
-        if response_x.failed or response_y.failed:
-            ascom_run(self, f'BinX = {current_binning.x}')
-            ascom_run(self, f'BinY = {current_binning.y}')
-            raise Exception(f'failures: {response_x.failure=}, {response_y.failure=}')
+        if (value.x, value.y) == (current_binning.x, current_binning.y):
+            return
+        failures = self.set_ascom_properties({'BinX': value.x, 'BinY': value.y})
+        if failures:
+            self.set_ascom_properties({'BinX': current_binning.x, 'BinY': current_binning.y})
+            raise Exception(f'failures: {failures}')
+        self._binning = CameraBinning(value.x, value.y)
+        self._roi = None    # the ROI is in binned pixels, the driver may have changed it
 
     @property
     def roi(self) -> CameraRoi:
@@ -255,32 +319,39 @@ class Camera(Component, SwitchedPowerDevice, AscomDispatcher):
 
     @roi.setter
     def roi(self, value: CameraRoi):
-        if 0 > value.startX > self.cameraXSize:
-            raise Exception(f'bad {value.startX=}, must be 0 > startX > {self.cameraXSize=}')
-        if 0 > value.startY > self.cameraYSize:
-            raise Exception(f'bad {value.startY=}, must be 0 > startY > {self.cameraYSize=}')
-        if 0 > value.numX > self.cameraXSize:
-            raise Exception(f'bad {value.numX=}, must be 0 > width > {self.cameraXSize=}')
-        if 0 > value.numY > self.cameraYSize:
-            raise Exception(f'bad {value.numY=}, must be 0 > height > {self.cameraYSize=}')
-        if value.startX + value.numX > self.cameraXSize:
-            raise Exception(f'{value.startX=} + {value.numX=} exceeds {self.cameraXSize=}')
-        if value.startY + value.numY > self.cameraYSize:
-            raise Exception(f'{value.startY=} + {value.numY=} exceeds {self.cameraYSize=}')
-
-        response_x = ascom_run(self, f'StartX ={value.startX}')
-        response_y = ascom_run(self, f'StartY = {value.startY}')
-        response_width = ascom_run(self, f'NumX = {value.numX}')
-        response_height = ascom_run(self, f'NumY = {value.numY}')
-
-        if response_x.failed or response_y.failed or response_height.failed or response_width.failed:
-            ascom_run(self, f'StartX = {self._roi.startX}')
-            ascom_run(self, f'StartY = {self._roi.startY}')
-            ascom_run(self, f'NumX = {self._roi.numX}')
-            ascom_run(self, f'NumY = {self._roi.numY}')
-
-            raise Exception(f'errors: {response_x.failure=}, {response_y.failure=}, ' +
-                            f'{response_width.failure=}, {response_height.failure=}')
+        # the sizes are unknown until read on connect, the driver will have its say then
+        if self.cameraXSize is not None:
+            if not (0 <= value.startX < self.cameraXSize):
+                raise Exception(f'bad {value.startX=}, must be 0 <= startX < {self.cameraXSize=}')
+            if not (0 < value.numX <= self.cameraXSize):
+                raise Exception(f'bad {value.numX=}, must be 0 < width <= {self.cameraXSize=}')
+            if value.startX + value.numX > self.cameraXSize:
+                raise Exception(f'{value.startX=} + {value.numX=} exceeds {self.cameraXSize=}')
+        if self.cameraYSize is not None:
+            if not (0 <= value.startY < self.cameraYSize):
+                raise Exception(f'bad {value.startY=}, must be 0 <= startY < {self.cameraYSize=}')
+            if not (0 < value.numY <= self.cameraYSize):
+                raise Exception(f'bad {value.numY=}, must be 0 < height <= {self.cameraYSize=}')
+            if value.startY + value.numY > self.cameraYSize:
+                raise Exception(f'{value.startY=} + {value.numY=} exceeds {self.cameraYSize=}')
+
+        current_roi = self._roi
+        if current_roi is not None and \
+                (value.startX, value.startY, value.numX, value.numY) == \
+                (current_roi.startX, current_roi.startY, current_roi.numX, current_roi.numY):
+            return
+
+        failures = self.set_ascom_properties({
+            'StartX': value.startX, 'StartY': value.startY, 'NumX': value.numX, 'NumY': value.numY,
+        })
+
+        if failures:
+            if current_roi is not None:
+                self.set_ascom_properties({
+                    'StartX': current_roi.startX, 'StartY': current_roi.startY,
+                    'NumX': current_roi.numX, 'NumY': current_roi.numY,
+                })
+            raise Exception(f'errors: {failures}')
         else:
             self._roi = CameraRoi(value.startX, value.startY, value.numX, value.numY)
 
@@ -288,8 +359,7 @@ class Camera(Component, SwitchedPowerDevice, AscomDispatcher):
     def connected(self) -> bool:
         if not self.is_on() or not self._ascom:
             return False
-        response = ascom_run(self, 'Connected')
-        return response.value if response.succeeded else False
+        return bool(self.ascom_cached('Connected'))
 
     @connected.setter
     def connected(self, value: bool):
@@ -297,40 +367,36 @@ class Camera(Component, SwitchedPowerDevice, AscomDispatcher):
             return
 
         response = ascom_run(self, f'Connected = {value}')
+        self.ascom_cache.pop('Connected', None)
         if response.succeeded:
             if value:
-                response = ascom_run(self, 'PixelSizeX')
-                if response.succeeded:
-                    self.PixelSizeX = response.value
+                props = self.get_ascom_properties(['PixelSizeX', 'PixelSizeY', 'MaxBinX', 'MaxBinY',
+                                                   'CameraXSize', 'CameraYSize', 'GainMin', 'GainMax',
+                                                   'MaxADU', 'BinX', 'BinY'])
+                if 'PixelSizeX' in props:
+                    self.PixelSizeX = props['PixelSizeX']
                     self._detected = True
-
-                response = ascom_run(self, 'PixelSizeY')
-                if response.succeeded:
-                    self.PixelSizeY = response.value
-
-                response = ascom_run(self, 'MaxBinX')
-                if response.succeeded:
-                    self.maxBinX = int(response.value)
-
-                response = ascom_run(self, 'MaxBinY')
-                if response.succeeded:
-                    self.maxBinY = int(response.value)
-
-                response = ascom_run(self, 'CameraXSize')
-                if response.succeeded:
-                    self.cameraXSize = response.value
-
-                response = ascom_run(self, 'CameraYSize')
-                if response.succeeded:
-                    self.cameraYSize = response.value
-
-                response = ascom_run(self, 'GainMin')
-                if response.succeeded:
-                    self.GainMin = response.value
-
-                response = ascom_run(self, 'GainMax')
-                if response.succeeded:
-                    self.GainMax = response.value
+                if 'PixelSizeY' in props:
+                    self.PixelSizeY = props['PixelSizeY']
+                if 'MaxBinX' in props:
+                    self.maxBinX = int(props['MaxBinX'])
+                if 'MaxBinY' in props:
+                    self.maxBinY = int(props['MaxBinY'])
+                if 'CameraXSize' in props:
+                    self.cameraXSize = props['CameraXSize']
+                if 'CameraYSize' in props:
+                    self.cameraYSize = props['CameraYSize']
+                if 'GainMin' in props:
+                    self.GainMin = props['GainMin']
+                if 'GainMax' in props:
+                    self.GainMax = props['GainMax']
+                if 'MaxADU' in props:
+                    self.image_dtype = np.uint16 if props['MaxADU'] <= np.iinfo(np.uint16).max else np.int32
+                if 'BinX' in props and 'BinY' in props:
+                    self._binning = CameraBinning(props['BinX'], props['BinY'])
+                # unknown until set by us, the setters will not skip the first writes
+                self._roi = None
+                self._gain = None
 
                 a = self.ascom_status()
                 logger.info(f"Camera: {a['ascom']['name']}, {a['ascom']['description']}, " +
@@ -342,6 +408,65 @@ class Camera(Component, SwitchedPowerDevice, AscomDispatcher):
             logger.info(f"failed connected = {value} (failure='{response.failure}')")
         self._detected = value
 
+    def get_ascom_properties(self, names: List[str]) -> dict:
+        """
+        Reads ASCOM properties directly through the driver's IDispatch, resolving each name's DISPID
+         only once, rather than having ascom_run() evaluate a command string per property
+
+        :param names: ASCOM property names
+        :return: A dictionary of the properties that were successfully read
+        """
+        ret = {}
+        ole = self._ascom._oleobj_
+        for name in names:
+            try:
+                ret[name] = ole.Invoke(self.dispid(name), 0, pythoncom.DISPATCH_PROPERTYGET, True)
+            except pythoncom.com_error as ex:
+                logger.error(f"could not get ASCOM property '{name}' (failure={ex})")
+        return ret
+
+    def ascom_cached(self, name: str, ttl: float = ASCOM_CACHE_SECONDS):
+        """
+        Reads an ASCOM property, unless it was read less than ttl seconds ago
+
+        :param name: The ASCOM property name
+        :param ttl: Maximal age (seconds) of a cached value
+        :return: The property's value, None if it could not be read
+        """
+        now = time.monotonic()
+        cached = self.ascom_cache.get(name)
+        if cached is not None and now - cached[1] < ttl:
+            return cached[0]
+
+        props = self.get_ascom_properties([name])
+        if name not in props:
+            self.ascom_cache.pop(name, None)
+            return None
+        self.ascom_cache[name] = (props[name], now)
+        return props[name]
+
+    def set_ascom_properties(self, values: dict) -> dict:
+        """
+        Sets ASCOM properties directly through the driver's IDispatch (see get_ascom_properties()),
+         in the order given
+
+        :param values: A dictionary of ASCOM property names and values
+        :return: A dictionary of the failures, by property name, empty if all were set
+        """
+        failures = {}
+        ole = self._ascom._oleobj_
+        for name, value in values.items():
+            try:
+                ole.Invoke(self.dispid(name), 0, pythoncom.DISPATCH_PROPERTYPUT, False, value)
+            except pythoncom.com_error as ex:
+                failures[name] = ex
+        return failures
+
+    def dispid(self, name: str) -> int:
+        if name not in self.dispids:
+            self.dispids[name] = self._ascom._oleobj_.GetIDsOfNames(name)
+        return self.dispids[name]
+
     @property
     def gain(self) -> int | None:
         response = ascom_run(self, 'Gain')
@@ -357,13 +482,15 @@ class Camera(Component, SwitchedPowerDevice, AscomDispatcher):
             raise Exception(f"cannot set gain, not connected")
 
         if self.GainMin is not None and self.GainMax is not None:
-            if self.GainMin > value > self.GainMax:
+            if not (self.GainMin <= value <= self.GainMax):
                 logger.error(f"Exception({value=} out of bounds [{self.GainMin=}, {self.GainMax=}]")
                 return
 
-        response = ascom_run(self, f'Gain = {value}')
-        if response.failed:
-            logger.error(f"Exception(failed to set Gain to {value}, error(s): {response.failure}")
+        if value == self._gain:
+            return
+        failures = self.set_ascom_properties({'Gain': value})
+        if failures:
+            logger.error(f"Exception(failed to set Gain to {value}, error(s): {failures['Gain']}")
             return
         self._gain = value
 
@@ -411,6 +538,29 @@ class Camera(Component, SwitchedPowerDevice, AscomDispatcher):
         #   binning=binning, save=True)
         self.do_start_exposure(context)
 
+    def prepare(self, settings: CameraSettings) -> List[str]:
+        """
+        Applies the gain, binning and ROI of the settings to the camera, ahead of the exposure.
+         Can be called while the mount and stage are still moving.
+
+        :return: A list of errors, empty on success
+        """
+        errors = []
+        try:
+            if settings.gain:
+                self.gain = settings.gain
+
+            if settings.binning:
+                self.binning = settings.binning
+
+            if settings.roi:
+                self.roi = settings.roi
+
+            self.prepared_settings = settings
+        except Exception as e:
+            errors.append(f"{e}")
+        return errors
+
     def do_start_exposure(self, settings: CameraSettings) -> CanonicalResponse:
         """
         Starts a *MAST* camera exposure
@@ -439,18 +589,9 @@ class Camera(Component, SwitchedPowerDevice, AscomDispatcher):
 
         self.errors = []
 
-        try:
-            if settings.gain:
-                self.gain = settings.gain
-
-            if settings.binning:
-                self.binning = settings.binning
-
-            if settings.roi:
-                self.roi = settings.roi
-
-        except Exception as e:
-            self.errors.append(f"{e}")
+        if settings is not self.prepared_settings:
+            self.errors = self.prepare(settings)
+        self.prepared_settings = None
 
         if len(self.errors) > 0:
             logger.error(f"{op}: {self.errors=}")
@@ -480,17 +621,22 @@ class Camera(Component, SwitchedPowerDevice, AscomDispatcher):
         if response.succeeded:
             self.start_activity(CameraActivities.Exposing)
             self.expected_mid_exposure = datetime.datetime.now() + datetime.timedelta(seconds=settings.seconds / 2)
+            # the timer may still be sleeping its idle interval, an exposure shorter than that would never
+            #  be sampled at mid-exposure, so start with the latest known temperature
+            self.ccd_temp_at_mid_exposure = self.thermal.get('temperature')
+            self.timer.interval = Camera.TIMER_BUSY_SECONDS
             self.image = None
             self.image_was_read = False
             self.image_was_saved = False
+            settings.saved = Future()  # per exposure, a save that is still pending cannot release the next one
             self.latest_settings = settings
 
-            if settings.save:
-                self.image_saved_event.wait()
-                self.image_saved_event.clear()
-            else:
-                self.image_ready_event.wait()
-                self.image_ready_event.clear()
+            self.readout_queue.put(settings.seconds)
+
+            # the image is written to disk in the background (see AsyncFrameWriter), we only wait for
+            #  it to be read out.  Callers needing the file use wait_for_image_saved(settings).
+            self.image_ready_event.wait()
+            self.image_ready_event.clear()
 
             self.end_activity(CameraActivities.Exposing)
         else:
@@ -557,9 +703,11 @@ class Camera(Component, SwitchedPowerDevice, AscomDispatcher):
         }
         if self.connected:
             ret['set_point'] = self.operational_set_point
-            ret['temperature'] = self._ascom.CCDTemperature
-            ret['cooler'] = self._ascom.CoolerOn
-            ret['cooler_power'] = self._ascom.CoolerPower
+            if (self.latest_temperature_check is not None and
+                    time.monotonic() - self.latest_temperature_check < self.temp_check_interval / 2):
+                ret |= self.thermal
+            else:
+                ret |= self.refresh_thermal()
             if self.latest_settings:
                 ret['latest_exposure'] = {}
                 ret['latest_exposure']['file'] = self.latest_settings.base_folder
@@ -617,6 +765,7 @@ class Camera(Component, SwitchedPowerDevice, AscomDispatcher):
         self.errors = []
         if self.connected:
             response = ascom_run(self, 'CoolerOn = False')
+            self.forget_cooler_state()
             if response.failed:
                 self.errors.append(f"could not set CoolerOn to False (failure='{response.failure}'")
             else:
@@ -660,10 +809,103 @@ class Camera(Component, SwitchedPowerDevice, AscomDispatcher):
         self.abort_exposure()
         return CanonicalResponse_Ok
 
+    def read_out_image(self) -> bool:
+        """
+        Downloads the image if the camera has it ready, and hands it over to the waiters, the visualizers
+         and the frame writer.  Called by the readout worker and, as a fallback, by onTimer().
+
+        :return: True if the image was read out (now or earlier)
+        """
+        if not self.image_lock.locked():    # it could be already locked by the readout worker or onTimer()
+            with self.image_lock:
+                #
+                # The lock is held in order to prevent the other reader (readout worker, onTimer) to act upon ImageReady
+                #  and possibly attempt to read the ImageArray.
+                #
+                # While the lock is held:
+                # - We check if ImageReady == True
+                # - If ImageReady == True:
+                #   - We read the image from the camara into self.image (CameraActivities.ReadingOut)
+                #   - We inform others that the image is available (in memory) by setting the image_ready_event
+                # - Optionally, in a separate thread (iff self.latest_exposure.file is not None):
+                #   - We save the image (CameraActivities.Saving)
+                #   - We inform others that the image was saved (to disk) by resolving latest_settings.saved
+                #
+                if self.image is None and not self.is_active(CameraActivities.ReadingOut):
+                    #
+                    # The readers may hit more than once while the image is being read.
+                    #  self.image becomes not None only after ALL the data was downloaded from the camera
+                    #
+                    response = ascom_run(self, 'ImageReady')
+                    if response.succeeded and response.value:
+                        self.start_activity(CameraActivities.ReadingOut)
+                        # download the image from the camera
+                        response = ascom_run(self, 'ImageArray')
+                        # stating the dtype (known since connect, from MaxADU) spares numpy a type-inference
+                        #  pass over the nested tuples and an int64 copy
+                        self.image = np.array(response.value, dtype=self.image_dtype) if response.succeeded else None
+                        self.end_activity(CameraActivities.ReadingOut)
+                        self.image_was_read = True
+                        # queued before image_ready_event is set, so the header and path are taken from
+                        #  latest_settings before the exposing thread may reuse them for the next exposure
+                        self.save_to_file()     # in the background, also informs everybody the file was saved
+                        self.image_ready_event.set()    # tell everybody the image is available (in memory)
+
+                        for visualizer in self.visualizers:
+                            visualizer.submit(self.image)
+        return self.image_was_read
+
+    def readout_worker(self):
+        """
+        Follows the exposures queued by do_start_exposure(), one at a time
+        """
+        while True:
+            seconds = self.readout_queue.get()
+            try:
+                self.follow_exposure(seconds)
+            except Exception as ex:
+                logger.error(f"readout of a {seconds} seconds exposure failed", exc_info=ex)
+
+    def follow_exposure(self, seconds: float):
+        """
+        Follows one exposure: sleeps through most of it, then polls ImageReady at a short interval and
+         reads the image out as soon as it is ready, rather than at the next (1 second) onTimer() tick
+        """
+        time.sleep(max(0.0, seconds - Camera.READOUT_LEAD_SECONDS))
+        deadline = time.monotonic() + Camera.READOUT_LEAD_SECONDS + Camera.READOUT_TIMEOUT_SECONDS
+        while self.is_active(CameraActivities.Exposing) and time.monotonic() < deadline:
+            if self.read_out_image():
+                return
+            time.sleep(Camera.READOUT_POLL_SECONDS)
+
+    def refresh_thermal(self) -> dict:
+        """
+        Reads the camera's temperature and cooler state in one batch and caches them (see status())
+
+        :return: The thermal part of the camera status
+        """
+        props = self.get_ascom_properties(['CCDTemperature', 'CoolerOn', 'CoolerPower'])
+        if props:
+            self.thermal = {
+                'temperature': props.get('CCDTemperature'),
+                'cooler': props.get('CoolerOn'),
+                'cooler_power': props.get('CoolerPower'),
+            }
+            self.latest_temperature_check = time.monotonic()
+        return self.thermal
+
+    def is_busy(self) -> bool:
+        """
+        While busy the timer polls at TIMER_BUSY_SECONDS, otherwise at TIMER_IDLE_SECONDS
+        """
+        return any(self.is_active(activity) for activity in Camera.BUSY_ACTIVITIES)
+
     def ontimer(self):
         """
         Called by timer, checks if any ongoing activities have changed state
         """
+        self.timer.interval = Camera.TIMER_BUSY_SECONDS if self.is_busy() else Camera.TIMER_IDLE_SECONDS
+
         if not self.connected:
             return
 
@@ -697,51 +939,13 @@ class Camera(Component, SwitchedPowerDevice, AscomDispatcher):
                 self.expected_mid_exposure = None
 
         if self.is_active(CameraActivities.Exposing) and current_state == AscomCameraState.Idle:
-            if not self.image_lock.locked():    # it could be already locked by a previous occurrence of onTimer()
-                with self.image_lock:
-                    #
-                    # The lock is held in order to prevent subsequent instances of onTimer() to act upon ImageReady
-                    #  and possibly attempt to read the ImageArray.
-                    #
-                    # While the lock is held:
-                    # - We check if ImageReady == True
-                    # - If ImageReady == True:
-                    #   - We read the image from the camara into self.image (CameraActivities.ReadingOut)
-                    #   - We inform others that the image is available (in memory) by setting the image_ready_event
-                    # - Optionally, in a separate thread (iff self.latest_exposure.file is not None):
-                    #   - We save the image (CameraActivities.Saving)
-                    #   - We inform others that the image is available (in memory) by setting the image_saved_event
-                    #
-                    if self.image is None and not self.is_active(CameraActivities.ReadingOut):
-                        #
-                        # The timer may hit more than once while the image is being read.
-                        #  self.image becomes not None only after ALL the data was downloaded from the camera
-                        #
-                        response = ascom_run(self, 'ImageReady')
-                        if response.succeeded and response.value:
-                            self.start_activity(CameraActivities.ReadingOut)
-                            # download the image from the camera
-                            response = ascom_run(self, 'ImageArray')
-                            self.image = np.array(response.value) if response.succeeded else None
-                            self.end_activity(CameraActivities.ReadingOut)
-                            self.image_was_read = True
-                            self.image_ready_event.set()    # tell everybody the image is available (in memory)
-
-                            for visualizer in self.visualizers:
-                                Thread(target=visualizer.func, name=f"{visualizer.name}", args=[self.image]).start()
-
-                            self.save_to_file()     # in a separate thread, also informs everybody the file was saved
-
-        if (self.latest_temperature_check and
-                (now - self.latest_temperature_check) >= datetime.timedelta(seconds=self.temp_check_interval)):
-            response = ascom_run(self, 'CCDTemperature')
-            if response.succeeded:
-                ccd_temp = response.value
-                self.latest_temperature_check = now
-                response = ascom_run(self, 'CoolerPower')
-                if response.succeeded:
-                    cooler_power = response.value
-                    logger.debug(f"{ccd_temp=}, {cooler_power=}")
+            # normally done by the readout worker, which follows each exposure, this is the safety net
+            self.read_out_image()
+
+        if (self.latest_temperature_check is None or
+                time.monotonic() - self.latest_temperature_check >= self.temp_check_interval):
+            thermal = self.refresh_thermal()
+            logger.debug(f"{thermal=}")
 
         # if self.is_active(CameraActivities.CoolingDown):
         #     ccd_temp = ascom_run(self, 'CCDTemperature')
@@ -765,15 +969,12 @@ class Camera(Component, SwitchedPowerDevice, AscomDispatcher):
 
     @property
     def operational(self) -> bool:
-        response = ascom_run(self, 'CoolerOn')
-
         return all([self.switch.detected, self.is_on(), self.detected, self._ascom,
-                    self._ascom.connected, response.succeeded, response.value])
+                    self.connected, self.ascom_cached('CoolerOn')])
 
     @property
     def why_not_operational(self) -> List[str]:
         label = f'{self.name}'
-        response = ascom_run(self, 'CoolerOn')
 
         ret = []
         if not self.switch.detected:
@@ -785,9 +986,9 @@ class Camera(Component, SwitchedPowerDevice, AscomDispatcher):
             ret.append(f"{label}: not detected")
         elif not self._ascom:
             ret.append(f"{label}: (ASCOM) - no handle")
-        elif not self._ascom.connected:
+        elif not self.connected:
             ret.append(f"{label}: (ASCOM) - not connected")
-        elif not (response.succeeded and response.value):
+        elif not self.ascom_cached('CoolerOn'):
             ret.append(f"{label}: (ASCOM) - cooler not ON")
 
         return ret
@@ -804,6 +1005,10 @@ class Camera(Component, SwitchedPowerDevice, AscomDispatcher):
     def was_shut_down(self) -> bool:
         return self._was_shut_down
 
+    def forget_cooler_state(self):
+        self.ascom_cache.pop('CoolerOn', None)
+        self.latest_temperature_check = None    # status() will refresh_thermal()
+
     def cooler_on(self):
         if not self.connected:
             self.errors.append('cooler_on: not connected')
@@ -811,6 +1016,7 @@ class Camera(Component, SwitchedPowerDevice, AscomDispatcher):
             return
 
         response = ascom_run(self, 'CoolerOn = True')
+        self.forget_cooler_state()
         if response.succeeded:
             logger.info(f"cooler turned ON")
         else:
@@ -824,6 +1030,7 @@ class Camera(Component, SwitchedPowerDevice, AscomDispatcher):
             return
 
         response = ascom_run(self, 'CoolerOn = False')
+        self.forget_cooler_state()
         if response.succeeded:
             logger.info(f"cooler turned OFF")
         else:
@@ -831,32 +1038,44 @@ class Camera(Component, SwitchedPowerDevice, AscomDispatcher):
         return response
 
     def save_to_file(self):
-        Thread(name='image-saver-thread', target=self.do_save_to_file).start()
-
-    def do_save_to_file(self):
+        """
+        Builds the FITS header and queues the image to the background frame writer.  Exposures
+         made with save=False are not written, their ``saved`` future resolves to None.
+        """
         op = function_name()
 
+        saved = self.latest_settings.saved
+        if not self.latest_settings.save:
+            # an in-memory only exposure, nothing to write
+            if saved is not None:
+                saved.set_result(None)
+            return
+
         if self.image is None:
             logger.error(f"{op}: image is None")
+            if saved is not None:
+                saved.set_result(None)
             return
 
         self.start_activity(CameraActivities.Saving)
 
-        header = fits.Header()
-        header['SIMPLE'] = (True, 'file conforms to FITS standard')
-        header['BITPIX'] = (32, 'array data type')
-        header['NAXIS'] = (2, 'number of array dimensions')
-        header['NAXIS1'] = (self.image.shape[0], 'length of data axis 1')
-        header['NAXIS2'] = (self.image.shape[1], 'length of data axis 2')
-        header['EXTEND'] = (True, 'FITS data sets may contain extensions')
-        header['DATE-OBS'] = (datetime.datetime.now(datetime.timezone.utc).isoformat(), )
-        # header['UT-START'] = (, )
-        # header['UT-END'] = (, )
-        header['XBINNING'] = self.binning.x
-        header['YBINNING'] = self.binning.y
-        # header['OBSERVER'] =
-        header['EXPTIME'] = (self.latest_settings.seconds, 'exposure time in seconds')
-        header['INSTRUME'] = (socket.gethostname(), 'the instrument')
+        # built in one go, rather than looking each keyword up before appending it
+        header = fits.Header([
+            ('SIMPLE', True, 'file conforms to FITS standard'),
+            ('BITPIX', 32, 'array data type'),
+            ('NAXIS', 2, 'number of array dimensions'),
+            ('NAXIS1', self.image.shape[0], 'length of data axis 1'),
+            ('NAXIS2', self.image.shape[1], 'length of data axis 2'),
+            ('EXTEND', True, 'FITS data sets may contain extensions'),
+            ('DATE-OBS', datetime.datetime.now(datetime.timezone.utc).isoformat()),
+            # ('UT-START', ),
+            # ('UT-END', ),
+            ('XBINNING', self.binning.x),
+            ('YBINNING', self.binning.y),
+            # ('OBSERVER', ),
+            ('EXPTIME', self.latest_settings.seconds, 'exposure time in seconds'),
+            ('INSTRUME', hostname, 'the instrument'),
+        ])
         if self.ccd_temp_at_mid_exposure:
             header['CCDTEMP'] = (self.ccd_temp_at_mid_exposure, 'ccd temp. at mid exposure')
             self.ccd_temp_at_mid_exposure = None
@@ -865,27 +1084,47 @@ class Camera(Component, SwitchedPowerDevice, AscomDispatcher):
             for k, v in self.latest_settings.fits_cards.items():
                 header[k] = v
 
-        hdu = fits.PrimaryHDU(data=np.transpose(self.image), header=fits.Header(header))
-        hdu_list = fits.HDUList([hdu])
-        logger.info(f'{op}: saving image to {self.latest_settings.image_path} ...')
-        hdu_list.writeto(self.latest_settings.image_path, checksum=True, overwrite=True)
-
-        self.image_was_saved = True
-        self.image_saved_event.set()
+        # FITS wants the frame row-major (NAXIS1 = x) and big-endian.  Doing both in one pass yields a
+        #  contiguous array that astropy writes as-is, rather than byte-swapping the (shared) self.image
+        #  in place and walking a non-contiguous transposed view element by element.
+        # The archived frames stay BITPIX=32, also when self.image is uint16 in memory (a uint16 frame
+        #  would be written as BITPIX=16 with BZERO=32768).
+        data = self.image.T.astype('>i4', order='C')
+        path = self.latest_settings.image_path
+        AsyncFrameWriter().write(path=path, data=data,
+                                 header=header, on_done=lambda error: self.on_image_saved(saved, path, error))
+
+    def on_image_saved(self, saved: Future | None, path: str | None, error: Exception | None):
+        self.image_was_saved = error is None
+        if saved is not None:
+            if error is None:
+                saved.set_result(path)
+            else:
+                saved.set_exception(error)
         self.end_activity(CameraActivities.Saving)
 
     def register_visualizer(self, name: str, visualizer: Callable):
         self.visualizers.append(Visualizer(name=name, func=visualizer))
         
-    def wait_for_image_saved(self):
+    def wait_for_image_saved(self, settings: CameraSettings | None = None) -> str | None:
+        """
+        Waits until the image of an exposure was written to disk
+
+        :param settings: The exposure's settings, defaults to the latest exposure's
+        :return: The image path, None if nothing was saved (including a failed write)
+        """
         op = function_name()
-        if not self.image_was_saved:
-            logger.info(f"{op}: image was not saved, waiting for image_saved_event ...")
-            self.image_saved_event.wait()
-            logger.info(f"{op}: image was not saved, got image_saved_event")
-            self.image_saved_event.clear()
-        else:
-            logger.info(f"{op}: image was saved, not waiting for image_saved_event.")
+        settings = settings or self.latest_settings
+        if settings is None or settings.saved is None:
+            logger.info(f"{op}: no exposure was started, not waiting.")
+            return None
+        if not settings.saved.done():
+            logger.info(f"{op}: image was not saved, waiting ...")
+        try:
+            return settings.saved.result()
+        except Exception as ex:
+            logger.error(f"{op}: image was not saved ({ex})")
+            return None
             
     def wait_for_image_ready(self):
         op = function_name()
@@ -903,7 +1142,7 @@ tag = 'Camera'
 
 camera = Camera()
 
-router = APIRouter()
+router = MastapiRouter()
 router.add_api_route(base_path + '/startup', tags=[tag], endpoint=camera.startup)
 router.add_api_route(base_path + '/shutdown', tags=[tag], endpoint=camera.shutdown)
 router.add_api_route(base_path + '/abort', tags=[tag], endpoint=camera.abort)
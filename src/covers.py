@@ -9,7 +9,7 @@ from common.utils import RepeatTimer, Component, time_stamp, CanonicalResponse,
 from common.config import Config
 from common.mast_logging import init_log
 from dlipower.dlipower.dlipower import SwitchedPowerDevice
-from fastapi.routing import APIRouter
+from mastapi import MastapiRouter
 
 from common.ascom import ascom_run, AscomDispatcher
 from common.activities import CoverActivities
@@ -284,7 +284,7 @@ tag = 'Covers'
 
 covers = Covers()
 
-router = APIRouter()
+router = MastapiRouter()
 router.add_api_route(base_path + '/startup', tags=[tag], endpoint=covers.startup)
 router.add_api_route(base_path + '/shutdown', tags=[tag], endpoint=covers.shutdown)
 router.add_api_route(base_path + '/abort', tags=[tag], endpoint=covers.abort)
@@ -1,5 +1,7 @@
 from typing import List
 import logging
+import threading
+import time
 from enum import IntFlag, IntEnum, auto
 import win32com.client
 
@@ -8,7 +10,7 @@ from common.config import Config
 from common.mast_logging import init_log
 from PlaneWave import pwi4_client
 from dlipower.dlipower.dlipower import SwitchedPowerDevice
-from fastapi.routing import APIRouter
+from mastapi import MastapiRouter
 from common.ascom import ascom_run, AscomDispatcher
 from common.activities import FocuserActivities
 from common.stopping import StoppingMonitor
@@ -27,6 +29,10 @@ class Focuser(Component, SwitchedPowerDevice, AscomDispatcher, StoppingMonitor):
     _instance = None
     _initialized = False
 
+    MOTION_MONITOR_INTERVAL: float = 0.1
+    MOTION_MONITOR_MAX_SECONDS: float = 180     # the timer takes over after that
+    MOTION_START_GRACE_SECONDS: float = 0.5
+
     @property
     def ascom(self) -> win32com.client.Dispatch:
         return self._ascom
@@ -59,6 +65,15 @@ class Focuser(Component, SwitchedPowerDevice, AscomDispatcher, StoppingMonitor):
         self.connect()
 
         self.target: int | None = None
+        self.motion_done_event: threading.Event = threading.Event()     # cleared while FocuserActivities.Moving
+        self.motion_done_event.set()
+        self.motion_lock: threading.Lock = threading.Lock()
+        self.motion_commanded_at: float = 0     # time.monotonic() of the latest goto
+        # one long-lived motion monitor, woken up by each goto
+        self.motion_started_event: threading.Event = threading.Event()
+        self.motion_monitor: threading.Thread = threading.Thread(name='focuser-motion-monitor',
+                                                                 target=self.monitor_motion, daemon=True)
+        self.motion_monitor.start()
         self.lower_limit = 0
         self.upper_limit = 30000
         response = ascom_run(self, 'MaxStep')
@@ -170,12 +185,74 @@ class Focuser(Component, SwitchedPowerDevice, AscomDispatcher, StoppingMonitor):
             logger.info(f"at {self.position=} (close enough to {value=})")
         else:
             self.target = value
+            self.motion_commanded_at = time.monotonic()
+            self.motion_done_event.clear()
             self.start_activity(FocuserActivities.Moving)
             self.pw.focuser_goto(value)
+            self.motion_started_event.set()
 
     def close_enough(self, position):
         return abs(self.position - position) <= 2
 
+    def monitor_motion(self):
+        """
+        Follows the focuser motions started by the position setter, one at a time
+        """
+        while True:
+            self.motion_started_event.wait()
+            self.motion_started_event.clear()
+            try:
+                self.follow_motion()
+            except Exception as ex:
+                logger.error(f"failed to follow the motion to {self.target=}", exc_info=ex)
+
+    def follow_motion(self):
+        """
+        Follows a focuser motion closely, so that waiters are released as soon as the target is reached,
+         rather than at the next (2 seconds) timer tick
+        """
+        deadline = time.monotonic() + Focuser.MOTION_MONITOR_MAX_SECONDS
+        while not self.motion_done_event.is_set() and time.monotonic() < deadline:
+            if self.check_motion_end():
+                return
+            time.sleep(Focuser.MOTION_MONITOR_INTERVAL)
+
+    def check_motion_end(self) -> bool:
+        """
+        Ends the Moving activity if the target was reached or PWI4 says the focuser stopped (wherever it did)
+
+        :return: True if the focuser is not moving anymore
+        """
+        with self.motion_lock:
+            if not self.is_active(FocuserActivities.Moving):
+                return True
+            stat = self.pw.status()
+            position = round(stat.focuser.position)
+            reached = self.target is not None and abs(position - self.target) <= 2
+            # the grace period keeps a status racing the goto from ending the motion before it started
+            stopped = not stat.focuser.is_moving and \
+                time.monotonic() - self.motion_commanded_at >= Focuser.MOTION_START_GRACE_SECONDS
+            if reached or stopped:
+                if not reached:
+                    logger.warning(f"focuser stopped at {position}, short of {self.target=}")
+                self.end_activity(FocuserActivities.Moving)
+                self.target = None
+                self.motion_done_event.set()
+                return True
+            return False
+
+    def wait_until_idle(self, timeout: float | None = None) -> bool:
+        """
+        Blocks until the current focuser motion has ended.
+
+        :param timeout: Maximal seconds to wait, None means forever
+        :return: True if the focuser is idle, False if the timeout expired
+        """
+        if self.motion_done_event.wait(timeout=timeout):
+            return True
+        # safety net: the event may have been missed, check once more
+        return self.check_motion_end()
+
     def set_position(self, position: int | str):
         """
         Sends the focuser to the specified position
@@ -246,19 +323,18 @@ class Focuser(Component, SwitchedPowerDevice, AscomDispatcher, StoppingMonitor):
         -------
 
         """
-        if self.is_active(FocuserActivities.Moving):
-            self.pw.focuser_stop()
-            self.end_activity(FocuserActivities.Moving)
+        with self.motion_lock:
+            if self.is_active(FocuserActivities.Moving):
+                self.pw.focuser_stop()
+                self.end_activity(FocuserActivities.Moving)
+            self.motion_done_event.set()
 
         if self.is_active(FocuserActivities.StartingUp):
             self.end_activity(FocuserActivities.StartingUp)
         return CanonicalResponse_Ok
 
     def ontimer(self):
-
-        if self.is_active(FocuserActivities.Moving) and self.close_enough(self.target):
-            self.end_activity(FocuserActivities.Moving)
-            self.target = None
+        self.check_motion_end()
 
     def status(self) -> dict:
         """
@@ -277,7 +353,7 @@ class Focuser(Component, SwitchedPowerDevice, AscomDispatcher, StoppingMonitor):
             'lower_limit': self.lower_limit,
             'upper_limit': self.upper_limit,
             'known_as_good_position': self.known_as_good_position,
-            'position': self.position,
+            'position': round(stat.focuser.position),
             'target': self.target,
             'target_verbal': f"{self.target}",
             'moving': is_moving,
@@ -302,14 +378,11 @@ class Focuser(Component, SwitchedPowerDevice, AscomDispatcher, StoppingMonitor):
         else:
             if self.was_shut_down:
                 ret.append(f"{self.name}: shut down")
-            if not self.detected:
+            st = self.pw.status()
+            if not st.focuser.exists:
                 ret.append(f"{self.name}: not detected")
-            else:
-                st = self.pw.status()
-                if not st.focuser.exists:
-                    ret.append(f"{self.name}: (PWI4) - does not exist")
-                elif not st.focuser.is_connected:
-                    ret.append(f"{self.name}: (PWI4) - not connected")
+            elif not st.focuser.is_connected:
+                ret.append(f"{self.name}: (PWI4) - not connected")
         return ret
 
     @property
@@ -331,7 +404,7 @@ tag = 'Focuser'
 
 focuser = Focuser()
 
-router = APIRouter()
+router = MastapiRouter()
 router.add_api_route(base_path + '/startup', tags=[tag], endpoint=focuser.startup)
 router.add_api_route(base_path + '/shutdown', tags=[tag], endpoint=focuser.shutdown)
 router.add_api_route(base_path + '/abort', tags=[tag], endpoint=focuser.abort)
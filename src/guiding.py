@@ -81,8 +81,8 @@ class Guider:
         if target is None:
             pw4_status = self.unit.pw.status()
             target = Coord(
-                ra=Angle(pw4_status.mount.ra_j2000_hours * u.hour),
-                dec=Angle(pw4_status.mount.dec_j2000_degs * u.deg)
+                ra=Angle(pw4_status.mount.ra_j2000_hours, unit=u.hour),
+                dec=Angle(pw4_status.mount.dec_j2000_degs, unit=u.deg)
             )
             logger.info(f"{op}: guiding at current coordinates {target}")
 
@@ -104,7 +104,7 @@ class Guider:
         cadence: float = guiding_conf['cadence_seconds']
         arc_seconds: float = guiding_conf['tolerance']['ra_arcsec'] if \
             ('tolerance' in guiding_conf and 'ra_arcsec' in guiding_conf['tolerance']) else .3
-        tolerance = Angle(arc_seconds * u.arcsec)
+        tolerance = Angle(arc_seconds, unit=u.arcsec)
 
         #
         # All is ready, start guiding
@@ -114,20 +114,23 @@ class Guider:
             start = datetime.datetime.now()
             if cadence != 0.0:
                 end = start + datetime.timedelta(seconds=cadence)
+            latest_acquisition = self.unit.acquirer.latest_acquisition
             self.unit.solver.solve_and_correct(target=target,
                                                camera_settings=guiding_settings,
                                                solving_tolerance=SolvingTolerance(tolerance, tolerance),
                                                phase='guiding',
-                                               parent_activity=UnitActivities.Guiding)
+                                               parent_activity=UnitActivities.Guiding,
+                                               hint=latest_acquisition.hint_for(target) if latest_acquisition else None)
 
             if cadence != 0.0:
                 now = datetime.datetime.now()
                 if now < end:
-                    sec = (end - now).seconds
-                    logger.info(f"sleeping {sec} seconds till end-of-cadence ...")
+                    sec = (end - now).total_seconds()
+                    logger.info(f"sleeping {sec:.1f} seconds till end-of-cadence ...")
                     time.sleep(sec)
 
         self.unit.acquirer.latest_acquisition.save_corrections('guiding')
+        self.unit.acquirer.latest_acquisition.flush_to_shared()
 
     # def do_guide_by_solving_without_shm(self, base_folder: str | None = None):
     #     def guiding_was_stopped() -> bool:
@@ -386,7 +389,7 @@ class Guider:
 
         executor = concurrent.futures.ThreadPoolExecutor()
         executor.thread_names_prefix = 'guiding-executor'
-        target: Coord = Coord(ra=Angle(ra_j2000_hours * u.hour), dec=Angle(dec_j2000_degs * u.deg))
+        target: Coord = Coord(ra=Angle(ra_j2000_hours, unit=u.hour), dec=Angle(dec_j2000_degs, unit=u.deg))
         future = executor.submit(self.do_guide_by_solving_with_shm, target=target, folder=None)
         time.sleep(2)
         if future.running():
@@ -1,3 +1,6 @@
+from fastapi.routing import APIRouter
+
+
 class Mastapi:
 
     tag = ':mastapi:'
@@ -5,3 +8,15 @@ class Mastapi:
     @staticmethod
     def is_api_method(func):
         return None if func.__doc__ is None else Mastapi.tag in func.__doc__
+
+
+class MastapiRouter(APIRouter):
+    """
+    An APIRouter whose routes, unless told otherwise, do not infer a response model from the
+     endpoint's return annotation.  Our endpoints build their responses themselves, so FastAPI
+     need not validate them again.
+    """
+
+    def add_api_route(self, path: str, endpoint, **kwargs):
+        kwargs.setdefault('response_model', None)
+        super().add_api_route(path, endpoint, **kwargs)
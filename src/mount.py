@@ -1,4 +1,5 @@
 import time
+import threading
 from logging import Logger
 
 import win32com.client
@@ -11,7 +12,7 @@ from common.utils import RepeatTimer, CanonicalResponse, CanonicalResponse_Ok, f
 from common.mast_logging import init_log
 from dlipower.dlipower.dlipower import SwitchedPowerDevice
 from common.config import Config
-from fastapi.routing import APIRouter
+from mastapi import MastapiRouter
 import math
 from astropy.coordinates import SkyCoord, frame_transform_graph, Angle
 from common.ascom import ascom_run, AscomDispatcher
@@ -26,6 +27,8 @@ class Mount(Component, SwitchedPowerDevice, AscomDispatcher, StoppingMonitor):
     _instance = None
     _initialized = False
 
+    SLEW_RECHECK_SECONDS: float = 0.2
+
     def __new__(cls, *args, **kwargs):
         if cls._instance is None:
             cls._instance = super(Mount, cls).__new__(cls)
@@ -75,6 +78,9 @@ class Mount(Component, SwitchedPowerDevice, AscomDispatcher, StoppingMonitor):
 
         self.errors = []
         self.target: str | tuple | None = None
+        self.slew_done_event: threading.Event = threading.Event()   # cleared while MountActivities.Slewing
+        self.slew_done_event.set()
+        self.slew_commanded_at: float = 0     # time.monotonic() of the latest goto
 
         self._initialized = True
         logger.info('initialized')
@@ -100,7 +106,12 @@ class Mount(Component, SwitchedPowerDevice, AscomDispatcher, StoppingMonitor):
 
     @property
     def connected(self) -> bool:
-        st = self.pw.status()
+        return self.is_connected(self.pw.status())
+
+    def is_connected(self, st: pwi4_client.PWI4Status) -> bool:
+        """
+        Same as the 'connected' property, but uses an already fetched PWI4 status
+        """
         response = ascom_run(self, 'Connected', True)
         return (self.ascom and
                 (response.succeeded and response.value) and
@@ -237,6 +248,7 @@ class Mount(Component, SwitchedPowerDevice, AscomDispatcher, StoppingMonitor):
         if not self.connected:
             return
 
+        fetched_at = time.monotonic()
         status = self.pw.status()
         if self.is_active(MountActivities.FindingHome):
             if not status.mount.is_slewing:
@@ -254,9 +266,12 @@ class Mount(Component, SwitchedPowerDevice, AscomDispatcher, StoppingMonitor):
                     self._was_shut_down = True
                     self.power_off()
 
-        if self.is_active(MountActivities.Slewing) and not status.mount.is_slewing:
+        # a status fetched before the latest goto was issued cannot tell that slew has ended
+        if (self.is_active(MountActivities.Slewing) and not status.mount.is_slewing and
+                fetched_at > self.slew_commanded_at):
             self.end_activity(MountActivities.Slewing)
             self.target = None
+            self.slew_done_event.set()
 
     def status(self) -> dict:
         """
@@ -275,8 +290,8 @@ class Mount(Component, SwitchedPowerDevice, AscomDispatcher, StoppingMonitor):
             target_verbal = (f"[{Angle(self.target[0], unit='hour').to_string(unit='hour', sep=':', precision=3)}, " +
                              f"{Angle(self.target[1], unit='arcsec').to_string(unit='deg', sep=':', precision=3)}]")
 
-        if self.connected:
-            st = self.pw.status()
+        st = self.pw.status()
+        if self.is_connected(st):
             ret['tracking'] = st.mount.is_tracking
             # integrate activities we may have not started
             if st.mount.is_tracking:
@@ -337,14 +352,58 @@ class Mount(Component, SwitchedPowerDevice, AscomDispatcher, StoppingMonitor):
         return CanonicalResponse_Ok
 
     def goto_ra_dec_j2000(self, ra: float, dec: float):
+        self.slew_commanded_at = time.monotonic()
+        self.slew_done_event.clear()
         self.start_activity(MountActivities.Slewing)
         self.target = (ra, dec)
         self.pw.mount_goto_ra_dec_j2000(ra, dec)
 
+    def wait_for_encoder_stable(self, threshold_arcsec: float = 0.5, window_seconds: float = 0.2,
+                                max_wait_seconds: float = 10, interval: float = 0.05) -> bool:
+        """
+        Waits for both mount axes to settle, i.e. their servo errors stay below threshold_arcsec
+         for at least window_seconds.
+
+        :return: True if the axes settled, False if max_wait_seconds expired
+        """
+        deadline = time.monotonic() + max_wait_seconds
+        stable_since: float | None = None
+        while time.monotonic() < deadline:
+            st = self.pw.status()
+            now = time.monotonic()
+            if all(abs(axis.servo_error_arcsec) <= threshold_arcsec for axis in st.mount.axis):
+                if stable_since is None:
+                    stable_since = now
+                elif now - stable_since >= window_seconds:
+                    return True
+            else:
+                stable_since = None
+            time.sleep(interval)
+        return False
+
     def goto_ra_dec_apparent(self, ra: float, dec: float):
+        self.slew_commanded_at = time.monotonic()
+        self.slew_done_event.clear()
         self.start_activity(MountActivities.Slewing)
         self.pw.mount_goto_ra_dec_apparent(ra, dec)
 
+    def wait_until_idle(self, timeout: float | None = None) -> bool:
+        """
+        Blocks until the current slew has ended.  PWI4 is asked once more after the slew_done_event,
+         so the wait never ends on a stale status.
+
+        :param timeout: Maximal seconds to wait, None means forever
+        :return: True if the mount is not slewing, False if the timeout expired
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if not self.slew_done_event.wait(timeout=timeout):
+            return False
+        while self.is_slewing:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(Mount.SLEW_RECHECK_SECONDS)
+        return True
+
     def abort(self):
         """
         Aborts any in-progress mount activities
@@ -360,13 +419,14 @@ class Mount(Component, SwitchedPowerDevice, AscomDispatcher, StoppingMonitor):
                 self.end_activity(activity)
         self.pw.mount_stop()
         self.pw.mount_tracking_off()
+        self.slew_done_event.set()
         return CanonicalResponse_Ok
 
     @property
     def operational(self) -> bool:
         st = self.pw.status()
-        return all([self.is_on(), self.detected, self.connected, not self.was_shut_down,
-                    self.ascom, st.mount.is_connected, st.mount.axis0.is_enabled, st.mount.axis1.is_enabled])
+        return all([self.is_on(), st.mount.is_connected, self.is_connected(st), not self.was_shut_down,
+                    self.ascom, st.mount.axis0.is_enabled, st.mount.axis1.is_enabled])
 
     @property
     def is_slewing(self):
@@ -379,7 +439,7 @@ class Mount(Component, SwitchedPowerDevice, AscomDispatcher, StoppingMonitor):
         ret = []
         if not self.is_on():
             ret.append(f"{label}: not powered")
-        elif not self.detected:
+        elif not st.mount.is_connected:
             ret.append(f"{label}: (PWI4) not detected")
         elif self.was_shut_down:
             ret.append(f"{label}: shut down")
@@ -451,7 +511,7 @@ tag = 'Mount'
 
 mount = Mount()
 
-router = APIRouter()
+router = MastapiRouter()
 router.add_api_route(base_path + '/startup', tags=[tag], endpoint=mount.startup)
 router.add_api_route(base_path + '/shutdown', tags=[tag], endpoint=mount.shutdown)
 router.add_api_route(base_path + '/abort', tags=[tag], endpoint=mount.abort)
@@ -1,3 +1,4 @@
+import functools
 import inspect
 from fastapi.openapi.utils import get_openapi
 
@@ -6,7 +7,7 @@ from mastapi import Mastapi
 from docstring_parser import parse, DocstringStyle
 from common.utils import Subsystem
 from common.mast_logging import init_log
-from typing import Union
+from typing import Union, Callable
 import logging
 import socket
 
@@ -23,18 +24,44 @@ class TypeToSchema:
         self.schema = schema
 
 
-def make_parameters(method_name, method, docstring) -> list:
+types_to_schemas = [
+    TypeToSchema(int, {'type': 'integer', 'format': 'int32'}),
+    TypeToSchema(float, {'type': 'number', 'format': 'float'}),
+    TypeToSchema(str, {'type': 'string'}),
+    TypeToSchema(Union[int, str], {'type': 'number', 'format': 'int32'}),
+    TypeToSchema(Union[float, str], {'type': 'number', 'format': 'float'}),
+    TypeToSchema(Union[stage.StagePresetPosition, str], {'type': 'string', 'enum':
+        ['Image', 'Spectra', 'Min', 'Max', 'Middle']}),
+    TypeToSchema(Union[stage.StageDirection, str], {'type': 'string', 'enum': ['Up', 'Down']}),
+]
+
+
+def is_exported(path: str, method_name: str, method) -> bool:
+    return (path == 'planewave' and method_name == 'status' or
+            method_name.startswith('mount_') or
+            method_name.startswith('focuser_') or
+            method_name.startswith('stage_') or
+            method_name.startswith('camera_') or
+            method_name.startswith('covers_') or
+            method_name.startswith('virtualcamera_')) or \
+        Mastapi.is_api_method(method)
+
+
+@functools.lru_cache(maxsize=None)
+def api_methods_of_class(cls: type, path: str) -> list[tuple[str, Callable]]:
+    """
+    The (name, function) pairs of the exported methods of a class, scanned once per class
+    """
+    ret = []
+    for name, member in inspect.getmembers(cls):
+        if isinstance(inspect.getattr_static(cls, name, None), staticmethod):
+            continue
+        if (inspect.isfunction(member) or inspect.ismethod(member)) and is_exported(path, name, member):
+            ret.append((name, member))
+    return ret
 
-    types_to_schemas = [
-        TypeToSchema(int, {'type': 'integer', 'format': 'int32'}),
-        TypeToSchema(float, {'type': 'number', 'format': 'float'}),
-        TypeToSchema(str, {'type': 'string'}),
-        TypeToSchema(Union[int, str], {'type': 'number', 'format': 'int32'}),
-        TypeToSchema(Union[float, str], {'type': 'number', 'format': 'float'}),
-        TypeToSchema(Union[stage.StagePresetPosition, str], {'type': 'string', 'enum':
-            ['Image', 'Spectra', 'Min', 'Max', 'Middle']}),
-        TypeToSchema(Union[stage.StageDirection, str], {'type': 'string', 'enum': ['Up', 'Down']}),
-    ]
+
+def make_parameters(method_name, method, docstring) -> list:
 
     parameters_list = list()
     annotations = inspect.get_annotations(method)
@@ -58,6 +85,16 @@ def make_parameters(method_name, method, docstring) -> list:
     return parameters_list
 
 
+@functools.lru_cache(maxsize=None)
+def parsed_docstring(function: Callable):
+    """
+    The method's docstring, stripped of the Mastapi tag and parsed, once per function
+    """
+    if not function.__doc__:
+        return None
+    return parse(function.__doc__.replace(Mastapi.tag + '\n', ''), style=DocstringStyle.NUMPYDOC)
+
+
 def make_openapi_schema(app, subsystems: list[Subsystem]):
 
     openapi_schema = get_openapi(
@@ -85,33 +122,21 @@ def make_openapi_schema(app, subsystems: list[Subsystem]):
 
     openapi_schema['paths'] = dict()
     for sub in subsystems:
-        tuples = inspect.getmembers(sub.obj, inspect.ismethod)
-        for tup in tuples:
-            method_name = tup[0]
-            method = tup[1]
+        for method_name, function in api_methods_of_class(type(sub.obj), sub.path):
+            # plain functions get bound to the subsystem's object, classmethods are already bound
+            method = function.__get__(sub.obj) if inspect.isfunction(function) else function
             path = f'/{sub.path}/{method_name}' if sub == 'unit' else f'/unit/{sub.path}/{method_name}'
-            if (sub.path == 'planewave' and method_name == 'status' or
-                    method_name.startswith('mount_') or
-                    method_name.startswith('focuser_') or
-                    method_name.startswith('stage_') or
-                    method_name.startswith('camera_') or
-                    method_name.startswith('covers_') or
-                    method_name.startswith('virtualcamera_')) or \
-                    Mastapi.is_api_method(method):
-                docstring = parse(method.__doc__.replace(':mastapi:\n', ''), style=DocstringStyle.NUMPYDOC) \
-                    if method.__doc__ else None
-                description = None
-                returns = None
-                raises = None
-                parameters = None
-                if docstring:
-                    description = docstring.short_description if docstring.short_description is not None else None
-                    returns = docstring.returns.description if docstring.returns is not None else None
-                    if len(docstring.raises) > 0:
-                        raises = docstring.raises[0].description
-                    parameters = make_parameters(method_name, method, docstring)
-            else:
-                continue
+            docstring = parsed_docstring(function)
+            description = None
+            returns = None
+            raises = None
+            parameters = None
+            if docstring:
+                description = docstring.short_description if docstring.short_description is not None else None
+                returns = docstring.returns.description if docstring.returns is not None else None
+                if len(docstring.raises) > 0:
+                    raises = docstring.raises[0].description
+                parameters = make_parameters(method_name, method, docstring)
 
             openapi_schema['paths'][path] = {
                 'get': {
@@ -5,11 +5,12 @@ from common.utils import function_name, Coord
 from common.mast_logging import init_log
 from common.filer import Filer
 from common.extended_basemodel import ExtendedBaseModel
-from acquisition import Acquisition
+from acquisition import Acquisition, SolvingTolerance
 import logging
 import time
 from typing import List, Literal, Optional
 from PlaneWave.ps3cli_client import PS3CLIClient
+from PlaneWave.platesolve import get_default_catalog_location
 from camera import CameraSettings
 from common.activities import UnitActivities
 from common.corrections import Corrections, Correction
@@ -20,9 +21,14 @@ import datetime
 from multiprocessing.shared_memory import SharedMemory
 import numpy as np
 import json
+from concurrent.futures import ThreadPoolExecutor, Future
+from threading import Thread
 
 PLATE_SOLVING_SHM_NAME = 'PlateSolving_Image'
 
+# moves the solving products (images, results) to the shared area, so the solving loop does not wait for it
+products_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='solver-products')
+
 logger = logging.Logger('mast.unit.' + __name__)
 init_log(logger)
 
@@ -80,22 +86,77 @@ class PS3SolvingResult(ExtendedBaseModel):
     solution: Optional[PS3SolvingSolution] = None
 
 
-class SolvingTolerance:
-    ra: Angle
-    dec: Angle
+def save_solver_result(result: PS3SolvingResult, file_name: str):
+    os.makedirs(os.path.dirname(file_name), exist_ok=True)
+    with open(file_name, 'w') as fp:
+        fp.write(json.dumps(result.dict(), indent=2))
+    Filer().move_ram_to_shared(file_name)
+
 
-    def __init__(self, ra: Angle, dec: Angle):
-        self.ra = ra
-        self.dec = dec
+def log_products_failure(future: Future):
+    """
+    Done-callback for the products_executor jobs, which are never waited on
+    """
+    if future.exception() is not None:
+        logger.error("a solving products job failed", exc_info=future.exception())
 
 
 class Solver:
 
+    WARMUP_CHUNK_SIZE: int = 1024 * 1024
+    # only this much of each catalog file is pre-read (its index and densest part), not the whole catalog
+    WARMUP_DEFAULT_MEGABYTES_PER_FILE: int = 64
+
     def __init__(self, unit: 'Unit'):
         self.unit: 'Unit' = unit
         self.latest_result: PS3SolvingResult | None = None
 
-    def plate_solve(self, settings: CameraSettings, target: Coord) -> PS3SolvingResult:
+        solving_conf = self.unit.unit_conf['solving'] if 'solving' in self.unit.unit_conf else {}
+        self.catalog_folder: str = solving_conf['catalog_folder'] if 'catalog_folder' in solving_conf \
+            else get_default_catalog_location()
+        self.warmup_bytes_per_file: int = 1024 * 1024 * (solving_conf['warmup_megabytes_per_file']
+                                                         if 'warmup_megabytes_per_file' in solving_conf
+                                                         else Solver.WARMUP_DEFAULT_MEGABYTES_PER_FILE)
+        Thread(name='solver-warmup-thread', target=self.warmup, daemon=True).start()
+
+    def warmup(self):
+        """
+        Reads the beginning (up to solving.warmup_megabytes_per_file, 0 disables the warmup) of each of the
+         plate solver's star catalog files once, so that it is in the OS file cache by the time the first
+         solve (of the session) needs it.
+        """
+        op = function_name()
+
+        if self.warmup_bytes_per_file <= 0:
+            logger.info(f"{op}: warmup disabled")
+            return
+
+        if not os.path.isdir(self.catalog_folder):
+            logger.info(f"{op}: no catalog folder '{self.catalog_folder}', skipping warmup")
+            return
+
+        start = time.monotonic()
+        total = 0
+        for root, _, files in os.walk(self.catalog_folder):
+            for file in files:
+                try:
+                    with open(os.path.join(root, file), 'rb') as fp:
+                        left = self.warmup_bytes_per_file
+                        while left > 0 and (chunk := fp.read(min(Solver.WARMUP_CHUNK_SIZE, left))):
+                            total += len(chunk)
+                            left -= len(chunk)
+                except OSError as ex:
+                    logger.warning(f"{op}: could not read '{file}' ({ex})")
+        logger.info(f"{op}: read {total / (1024 * 1024):.0f} MB from '{self.catalog_folder}' " +
+                    f"in {time.monotonic() - start:.1f} seconds")
+
+    def plate_solve(self, settings: CameraSettings, target: Coord,
+                    hint: PS3SolvingSolution | None = None) -> PS3SolvingResult:
+        """
+        Exposes and plate solves the image.  When a hint (a previous solution of the same
+         field) is supplied, its center and pixel scale seed the solver, rather than the target
+         and the configured pixel scale.
+        """
         op = function_name()
 
         while self.unit.is_active(UnitActivities.Solving):
@@ -120,7 +181,14 @@ class Solver:
             if settings.binning.x != settings.binning.y:
                 raise Exception(f"cannot deal with non-equal horizontal and vertical binning " +
                                 f"({settings.binning.x=}, {settings.binning.y=}")
-            pixel_scale = self.unit.unit_conf['camera']['pixel_scale_at_bin1'] * settings.binning.x
+            pixel_scale_at_bin1 = self.unit.unit_conf['camera']['pixel_scale_at_bin1']
+            pixel_scale = pixel_scale_at_bin1 * settings.binning.x
+            ra_guess_rads, dec_guess_rads = target.ra.radian, target.dec.radian
+            if hint:
+                # the hint may come from an image with another binning, its scale is rebinned to ours
+                hint_binning = max(1, round(hint.matched_arcsec_per_pixel / pixel_scale_at_bin1))
+                pixel_scale = hint.matched_arcsec_per_pixel / hint_binning * settings.binning.x
+                ra_guess_rads, dec_guess_rads = hint.center_ra_j2000_rads, hint.center_dec_j2000_rads
 
             filer = Filer()
 
@@ -144,8 +212,8 @@ class Solver:
                 enable_all_sky_match=True,
                 enable_local_quad_match=True,
                 enable_local_triangle_match=True,
-                ra_guess_j2000_rads=target.ra.radian,
-                dec_guess_j2000_rads=target.dec.radian
+                ra_guess_j2000_rads=ra_guess_rads,
+                dec_guess_j2000_rads=dec_guess_rads
             )
 
             solver_status: PS3SolvingResult
@@ -167,8 +235,9 @@ class Solver:
                 else:
                     time.sleep(.1)
 
-            self.unit.camera.wait_for_image_saved()
-            filer.move_ram_to_shared(settings.image_path)
+            if self.unit.camera.wait_for_image_saved(settings):
+                products_executor.submit(filer.move_ram_to_shared, settings.image_path).add_done_callback(
+                    log_products_failure)
 
             return solver_status
 
@@ -178,7 +247,9 @@ class Solver:
                           solving_tolerance: SolvingTolerance,
                           parent_activity: Optional[UnitActivities] = None,
                           phase: Optional[str] = None,
-                          max_tries: int = 3) -> bool:
+                          max_tries: int = 3,
+                          hint: Optional[PS3SolvingSolution] = None,
+                          max_wall_seconds: Optional[float] = None) -> bool:
         """
         Tries for max_tries times to:
         - Take an exposure using camera_settings
@@ -192,6 +263,8 @@ class Solver:
         :param parent_activity: If the parent_activity (e.g. UnitActivities.Acquiring, UnitActivities.Guiding) is stopped, this function stops as well
         :param max_tries: How many times to try to get withing the solving_tolerance
         :param phase: One of ['sky', 'spec', 'guiding']
+        :param hint: A previous solution of this field, seeds the solver's guesses
+        :param max_wall_seconds: If supplied, no new try is started after this many seconds
 
         :rtype: bool
         :return: True if succeeded to achieve tolerances within max_tries, False otherwise
@@ -210,8 +283,8 @@ class Solver:
         if not self.unit.acquirer.latest_acquisition:
             # when not part of an acquisition sequence
             self.unit.acquirer.latest_acquisition = Acquisition(
-                target.ra.arcsecond,
-                target.dec.arcsecond,
+                target.ra.hour,
+                target.dec.deg,
                 {
                     'tolerance': {
                         'ra_arcsec': solving_tolerance.ra.arcsecond,
@@ -232,16 +305,21 @@ class Solver:
             )
         latest_corrections = self.unit.acquirer.latest_acquisition.corrections[phase]
 
+        start = time.monotonic()
         for try_number in range(max_tries):
             if was_cancelled():
                 return False
 
+            if max_wall_seconds is not None and time.monotonic() - start > max_wall_seconds:
+                logger.info(f"{op}: giving up after {max_wall_seconds=} ({try_number=} of {max_tries=})")
+                break
+
             logger.info(f"{op}: calling plate_solve ({try_number=} of {max_tries=})")
 
             # run the plate solver
             result = None
             try:
-                result = self.plate_solve(target=target, settings=camera_settings)
+                result = self.plate_solve(target=target, settings=camera_settings, hint=hint)
             except TimeoutError:
                 self.log_and_store_error(f"plate solving timed out, continuing ...")
                 continue
@@ -251,13 +329,10 @@ class Solver:
                 self.log_and_store_error(f"{op}: {try_number=}, plate_solve returned None")
                 continue
 
-            # save the solver result for debugging
-            result_file_name = camera_settings.image_path.replace('.fits', '-solver_result.json')
-            os.makedirs(os.path.dirname(result_file_name), exist_ok=True)
-            with open(result_file_name, 'w') as fp:
-                fp.write(json.dumps(result.dict(), indent=2))
-            time.sleep(2)
-            Filer().move_ram_to_shared(result_file_name)
+            # save the solver result for debugging, off the solving loop
+            products_executor.submit(save_solver_result, result,
+                                     camera_settings.image_path.replace('.fits', '-solver_result.json')
+                                     ).add_done_callback(log_products_failure)
 
             #
             # From "PlateSolve3 server documentation"
@@ -283,21 +358,27 @@ class Solver:
                 elif result.last_log_message:
                     msg = f"last_log_message: '{result.last_log_message}'"
                 self.log_and_store_error(f"{op}: {try_number=}, plate solver failed, {result.state=}, {msg=}")
+                if hint:
+                    logger.info(f"{op}: dropping the hint, next try will be seeded with the target")
+                    hint = None
+                # nor will a later solve (e.g. the next guiding cycle) be seeded with it
+                self.unit.acquirer.latest_acquisition.last_solution = None
                 self.unit.end_activity(UnitActivities.Solving)
                 continue  # next try
 
             elif result.state == 'found_match':
                 logger.info(f"{op}: >>>>> plate solver found a match, YEY, YEPEEE, HURRAY !!! <<<")
-                solved_ra_arcsec: float = Angle(result.solution.center_ra_j2000_rads * u.radian).arcsecond
-                solved_dec_arcsec: float = Angle(result.solution.center_dec_j2000_rads * u.radian).arcsecond
+                self.unit.acquirer.latest_acquisition.last_solution = result.solution
+                coord_solved = Coord(ra=Angle(result.solution.center_ra_j2000_rads, unit=u.radian),
+                                     dec=Angle(result.solution.center_dec_j2000_rads, unit=u.radian))
+                solved_ra_arcsec: float = coord_solved.ra.arcsecond
+                solved_dec_arcsec: float = coord_solved.dec.arcsecond
 
                 delta_dec_arcsec: float = target.dec.arcsecond - solved_dec_arcsec
-                ang_rad: float = Angle(((target.dec.arcsecond + solved_dec_arcsec) / 2) * u.arcsecond).radian
+                ang_rad: float = math.radians(((target.dec.arcsecond + solved_dec_arcsec) / 2) / 3600)
                 delta_ra_arcsec: float = (target.ra.arcsecond - solved_ra_arcsec) * math.cos(ang_rad)
 
-                coord_solved = Coord(ra=Angle(result.solution.center_ra_j2000_rads * u.radian),
-                                     dec=Angle(result.solution.center_dec_j2000_rads * u.radian))
-                coord_delta = Coord(ra=Angle(delta_ra_arcsec * u.arcsecond), dec=Angle(delta_dec_arcsec * u.arcsecond))
+                coord_delta = Coord(ra=Angle(delta_ra_arcsec, unit=u.arcsec), dec=Angle(delta_dec_arcsec, unit=u.arcsec))
                 coord_tolerance = Coord(ra=solving_tolerance.ra, dec=solving_tolerance.dec)
                 logger.info(f"{op}: target: {target}, solved: {coord_solved}, delta: {coord_delta}, " +
                             f"tolerance: {coord_tolerance}")
@@ -345,8 +426,8 @@ class Solver:
                     self.unit.pw.mount_offset(ra_add_arcsec=delta_ra_arcsec, dec_add_arcsec=delta_dec_arcsec)
                     while self.unit.mount.is_slewing:
                         time.sleep(.5)
-                    logger.info(f"sleeping 5 additional seconds to let the mount stop moving ...")
-                    time.sleep(5)
+                    if not self.unit.mount.wait_for_encoder_stable(max_wait_seconds=5):
+                        logger.warning(f"{op}: mount axes did not settle within 5 seconds")
                     self.unit.end_activity(UnitActivities.Correcting)
                     logger.info(f"{op}: {try_number=}, " +
                                 f"corrected by {delta_ra_arcsec=:.6f}, {delta_dec_arcsec=:.6f}")
@@ -355,10 +436,10 @@ class Solver:
                 continue    # next try
 
         #
-        # By now the tries have been exhausted, and we're still not within tolerance
+        # By now the tries (or the time) have been exhausted, and we're still not within tolerance
         #
 
-        logger.info(f"{op}: could not reach tolerances within {max_tries=}")
+        logger.info(f"{op}: could not reach tolerances within {max_tries=}, {max_wall_seconds=}")
         self.unit.end_activity(UnitActivities.Solving)
         return False
 
@@ -13,7 +13,7 @@ from dlipower.dlipower.dlipower import SwitchedPowerDevice
 import os
 import sys
 import platform
-from fastapi.routing import APIRouter
+from mastapi import MastapiRouter
 from common.activities import StageActivities
 from common.stopping import StoppingMonitor
 from common.dlipowerswitch import SwitchedOutlet
@@ -66,6 +66,8 @@ class Stage(Component, SwitchedPowerDevice, StoppingMonitor):
     _instance = None
     _initialized = False
 
+    MOTION_START_GRACE_SECONDS: float = 1
+
     def __new__(cls, *args, **kwargs):
         if cls._instance is None:
             cls._instance = super(Stage, cls).__new__(cls)
@@ -96,6 +98,9 @@ class Stage(Component, SwitchedPowerDevice, StoppingMonitor):
         self.is_moving: bool = False
         self.target: int | None = None
         self.stage_lock: threading.Lock | None = None
+        self.motion_done_event: threading.Event = threading.Event()     # cleared while StageActivities.Moving
+        self.motion_done_event.set()
+        self.motion_commanded_at: float | None = None  # time.monotonic() of the latest move command
         self.min_travel: int | None = None
         self.max_travel: int | None = None
 
@@ -286,6 +291,8 @@ class Stage(Component, SwitchedPowerDevice, StoppingMonitor):
         with self.stage_lock:
             result = ximclib.command_move(self.device, value)
         if result == Result.Ok:
+            self.motion_commanded_at = time.monotonic()
+            self.motion_done_event.clear()
             self.start_activity(StageActivities.Moving)
         else:
             raise Exception(f'Could not start move to {value} ({result=})')
@@ -340,9 +347,17 @@ class Stage(Component, SwitchedPowerDevice, StoppingMonitor):
             self.is_moving = hw_status.MvCmdSts & MvcmdStatus.MVCMD_RUNNING
 
         if not self.is_moving:
-            if self.is_active(StageActivities.Moving) and self.close_enough(self.target):
+            # the motion ended when the controller stopped running it, wherever the stage stopped.  The grace
+            #  period keeps a status read racing the move command from ending the motion before it started.
+            if self.is_active(StageActivities.Moving) and (
+                    self.close_enough(self.target) or
+                    self.motion_commanded_at is None or
+                    time.monotonic() - self.motion_commanded_at >= Stage.MOTION_START_GRACE_SECONDS):
+                if not self.close_enough(self.target):
+                    logger.warning(f"stage stopped at {self._position}, short of {self.target=}")
                 self.target = None
                 self.end_activity(StageActivities.Moving)
+                self.motion_done_event.set()
 
             if (self.is_active(StageActivities.StartingUp) and
                     self.close_enough(self.presets[StagePresetPosition.StartUp])):
@@ -410,6 +425,8 @@ class Stage(Component, SwitchedPowerDevice, StoppingMonitor):
         self.target = position
         self.motion_start_time = datetime.datetime.now()
         logger.info(f'{op}: move: from {self.position=} to {self.target=}')
+        self.motion_commanded_at = time.monotonic()
+        self.motion_done_event.clear()
         self.start_activity(StageActivities.Moving)
 
         return CanonicalResponse_Ok
@@ -436,6 +453,8 @@ class Stage(Component, SwitchedPowerDevice, StoppingMonitor):
         amount *= 1 if direction == StageDirection.Up else -1
         try:
             self.target = self.position + amount
+            self.motion_commanded_at = time.monotonic()
+            self.motion_done_event.clear()
             self.start_activity(StageActivities.Moving)
             with self.stage_lock:
                 response = ximclib.command_movr(self.device, amount, 0)
@@ -449,6 +468,18 @@ class Stage(Component, SwitchedPowerDevice, StoppingMonitor):
             return CanonicalResponse(exception=ex)
         return CanonicalResponse_Ok
 
+    def wait_until_idle(self, timeout: float | None = None) -> bool:
+        """
+        Blocks until the stage status reader (ontimer) reports the end of the current motion.
+
+        :param timeout: Maximal seconds to wait, None means forever
+        :return: True if the stage is idle, False if the timeout expired
+        """
+        if self.motion_done_event.wait(timeout=timeout):
+            return True
+        # safety net: the event may have been missed, poll the driver once more
+        return not self.is_moving and not self.is_active(StageActivities.Moving)
+
     def abort(self):
         """
         Aborts any in-progress stage activities
@@ -463,6 +494,7 @@ class Stage(Component, SwitchedPowerDevice, StoppingMonitor):
                 self.end_activity(activity)
 
         ximclib.command_stop(self.device)
+        self.motion_done_event.set()
         return CanonicalResponse_Ok
 
     @property
@@ -515,7 +547,7 @@ def set_position(pos: int):
     return CanonicalResponse_Ok
 
 
-router = APIRouter()
+router = MastapiRouter()
 router.add_api_route(base_path + '/startup', tags=[tag], endpoint=stage.startup)
 router.add_api_route(base_path + '/shutdown', tags=[tag], endpoint=stage.shutdown)
 router.add_api_route(base_path + '/abort', tags=[tag], endpoint=stage.abort)
@@ -1,3 +1,4 @@
+import asyncio
 import datetime
 import io
 import os
@@ -27,7 +28,7 @@ from common.activities import CoverActivities, StageActivities, MountActivities
 from common.corrections import correction_phases
 from common.paths import PathMaker
 from enum import Enum
-from fastapi.routing import APIRouter
+from mastapi import MastapiRouter
 from PIL import Image
 import ipaddress
 from starlette.websockets import WebSocket, WebSocketDisconnect
@@ -168,6 +169,7 @@ class Unit(Component):
     def do_shutdown(self):
         self.start_activity(UnitActivities.ShuttingDown)
         [comp.shutdown() for comp in self.components]
+        self.autofocuser.close()
         self._was_shut_down = True
 
     def shutdown(self):
@@ -319,6 +321,30 @@ class Unit(Component):
 
         [component.abort() for component in self.components]
 
+    def wait_until_idle(self, timeout: float, stage: bool = True, mount: bool = True,
+                        focuser: bool = True) -> List[str]:
+        """
+        Blocks until the selected moving components (stage, mount, focuser) signal end-of-motion.
+         The timeout is shared by all the components, not applied to each of them.
+
+        :param timeout: Maximal seconds to wait, in total
+        :return: The names of the components that were still moving when the timeout expired
+        """
+        waiters = []
+        if stage:
+            waiters.append((self.stage.name, self.stage.wait_until_idle))
+        if mount:
+            waiters.append((self.mount.name, self.mount.wait_until_idle))
+        if focuser:
+            waiters.append((self.focuser.name, self.focuser.wait_until_idle))
+
+        deadline = time.monotonic() + timeout
+        still_moving = []
+        for name, wait in waiters:
+            if not wait(timeout=max(deadline - time.monotonic(), 0)):
+                still_moving.append(name)
+        return still_moving
+
     def ontimer(self):
         """
         Used in order to end activities that were started elsewhere in the code.
@@ -432,12 +458,17 @@ class Unit(Component):
             self.connected_clients.remove(websocket)
             logger.info(f"removed {websocket} from self.connected_clients")
 
-    async def push_image_to_dashboards(self, image: np.ndarray):
-        transposed_image = np.transpose(image.astype(np.uint16))
+    @staticmethod
+    def image_to_png(image: np.ndarray) -> bytes:
+        transposed_image = np.transpose(image.astype(np.uint16, copy=False))
         image_pil = Image.fromarray(transposed_image)
         with io.BytesIO() as output:
             image_pil.save(output, format="PNG")
-            png_data = output.getvalue()
+            return output.getvalue()
+
+    async def push_image_to_dashboards(self, image: np.ndarray):
+        # the PNG encoding is CPU bound, keep it off the event loop
+        png_data = await asyncio.to_thread(Unit.image_to_png, image)
 
         for websocket in self.connected_clients:
             try:
@@ -512,8 +543,8 @@ class Unit(Component):
                 save=True)
             logger.info(f"{op}: starting exposure #{repeat} (of {repeats})")
             self.camera.do_start_exposure(context)
-            self.camera.wait_for_image_saved()
-            Filer().move_ram_to_shared(self.camera.latest_settings.image_path)
+            if self.camera.wait_for_image_saved(context):
+                Filer().move_ram_to_shared(context.image_path)
 
             if seconds_between_exposures != 0.0:
                 now = datetime.datetime.now()
@@ -579,9 +610,9 @@ class Unit(Component):
                 }, save=True)
 
             self.camera.do_start_exposure(exposure_settings)
-            self.camera.wait_for_image_saved()
-            logger.info(f"{op}: reference image was saved")
-            Filer().move_ram_to_shared(exposure_settings.image_path)
+            if self.camera.wait_for_image_saved(exposure_settings):
+                logger.info(f"{op}: reference image was saved")
+                Filer().move_ram_to_shared(exposure_settings.image_path)
 
             # expose at shifted position
             logger.info(f"{op}: moving stage to shifted {position=}")
@@ -601,9 +632,9 @@ class Unit(Component):
                 },
                 save=True)
             self.camera.do_start_exposure(exposure_settings)
-            self.camera.wait_for_image_saved()
-            logger.info(f"{op}: image at {position=} was saved")
-            Filer().move_ram_to_shared(exposure_settings.image_path)
+            if self.camera.wait_for_image_saved(exposure_settings):
+                logger.info(f"{op}: image at {position=} was saved")
+                Filer().move_ram_to_shared(exposure_settings.image_path)
 
         logger.info(f"{op}: done.")
         return CanonicalResponse_Ok
@@ -642,7 +673,7 @@ def unit_route(sub_path: str):
     return base_path + sub_path
 
 
-router = APIRouter()
+router = MastapiRouter()
 router.add_api_route(base_path + '/startup', tags=[tag], endpoint=unit.startup)
 router.add_api_route(base_path + '/shutdown', tags=[tag], endpoint=unit.shutdown)
 router.add_api_route(base_path + '/abort', tags=[tag], endpoint=unit.abort)
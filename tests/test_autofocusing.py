@@ -0,0 +1,104 @@
+import importlib
+import os
+import sys
+import types
+from concurrent.futures import Future
+from unittest.mock import MagicMock
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+ACQUISITION_CONF = {
+    'gain': 100,
+    'roi': {'fiber_x': 1000, 'fiber_y': 1000, 'width': 400, 'height': 300},
+}
+
+
+class StubCameraSettings:
+    """
+    Stands in for camera.CameraSettings, keeping the part of its contract the autofocus relies upon:
+     the constructor creates the base_folder, setting image_path creates nothing
+    """
+    def __init__(self, seconds, gain=None, binning=None, roi=None, base_folder=None, save=True, **kwargs):
+        self.seconds = seconds
+        self.gain = gain
+        self.binning = binning
+        self.roi = roi
+        self.base_folder = base_folder
+        self.save = save
+        self.image_path = None
+        self.saved = None
+        if save:
+            os.makedirs(base_folder, exist_ok=True)
+
+
+class StubExtendedBaseModel:
+    """
+    Stands in for the pydantic-based ExtendedBaseModel, the unset fields keep their class defaults
+    """
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+@pytest.fixture
+def autofocusing(monkeypatch):
+    """
+    Imports autofocusing with stubs for the modules that talk to the hardware (and Windows COM) at
+     import time and for the 'common' submodule
+    """
+    common = types.ModuleType('common')
+    monkeypatch.setitem(sys.modules, 'common', common)
+    for name in ('utils', 'paths', 'mast_logging', 'filer', 'config', 'activities'):
+        monkeypatch.setitem(sys.modules, f'common.{name}', MagicMock())
+    extended_basemodel = types.ModuleType('common.extended_basemodel')
+    extended_basemodel.ExtendedBaseModel = StubExtendedBaseModel
+    monkeypatch.setitem(sys.modules, 'common.extended_basemodel', extended_basemodel)
+
+    camera = types.ModuleType('camera')
+    camera.CameraSettings = StubCameraSettings
+    camera.CameraBinning = MagicMock()
+    monkeypatch.setitem(sys.modules, 'camera', camera)
+    for name in ('stage', 'plotting', 'acquisition', 'async_writer'):
+        monkeypatch.setitem(sys.modules, name, MagicMock())
+
+    monkeypatch.delitem(sys.modules, 'autofocusing', raising=False)
+    module = importlib.import_module('autofocusing')
+    yield module
+    sys.modules.pop('autofocusing', None)
+
+
+def test_every_try_writes_into_its_own_folder(autofocusing, tmp_path, monkeypatch):
+    folders = [str(tmp_path / 'try0'), str(tmp_path / 'try1')]
+    autofocusing.PathMaker.return_value.make_autofocus_folder.side_effect = folders
+    monkeypatch.setattr(autofocusing.Autofocuser, 'ANALYSIS_POLL_MIN_SECONDS', 0)
+
+    def start_exposure(settings):
+        # what the frame writer does: fails if the folder does not exist
+        with open(settings.image_path, 'wb') as f:
+            f.write(b'')
+        settings.saved = Future()
+        settings.saved.set_result(settings.image_path)
+
+    unit = MagicMock()
+    unit.unit_conf = {
+        'acquisition': ACQUISITION_CONF,
+        'autofocus': {'max_tries': 2, 'max_tolerance': 10},
+        'focuser': {'known_as_good_position': 1000},
+    }
+    unit.camera.do_start_exposure.side_effect = start_exposure
+
+    autofocuser = autofocusing.Autofocuser(unit)
+    analysed = []
+    monkeypatch.setattr(autofocuser, 'begin_analyze_focus', lambda files: analysed.append(files))
+    # each try: the analyser starts, then stops without a result, so the next try is made
+    statuses = iter([{'is_running': True}, {'is_running': False}] * 2)
+    monkeypatch.setattr(autofocuser, 'focus_status', lambda: next(statuses))
+
+    autofocuser.do_start_wis_autofocus(exposure=1, ticks_per_step=50, number_of_images=3)
+
+    assert len(analysed) == 2
+    for folder, files in zip(folders, analysed):
+        assert os.path.isdir(folder)
+        assert len(files) == 3
+        assert all(os.path.dirname(file) == folder and os.path.isfile(file) for file in files)